@@ -24,6 +24,15 @@
 # Original: /usr/local/bin/api-server.py (in hatch.yaml write_files)
 # =============================================================================
 import http.server,socketserver,subprocess,json,os,base64,hmac,hashlib,time
+# Prefer orjson for writing uploaded configs: C serializer, emits bytes directly.
+# Values orjson rejects (e.g. integers over 64 bits) fall back to json.
+try:
+  import orjson
+  def _dump_config(data):
+    try:return orjson.dumps(data,option=orjson.OPT_INDENT_2)
+    except TypeError:return json.dumps(data,indent=2).encode()
+except ImportError:
+  def _dump_config(data):return json.dumps(data,indent=2).encode()
 PORT=8080
 API_SECRET=os.getenv('API_SECRET','')
 API_BIND_ADDRESS=os.getenv('API_BIND_ADDRESS','127.0.0.1')
@@ -86,14 +95,21 @@ def get_status():
   ready=setup_done and bot_online and not needs_check
   return {"phase":p,"stage":s,"desc":desc,"bot_online":bot_online,"phase1_complete":p1_done,"phase2_complete":p2_done,"ready":ready,"rebooting":rebooting,"safe_mode":safe_mode,"services":svc if svc else None}
 
+# Optional upload fields: (key, required type, error when present with another type)
+_UPLOAD_FIELD_TYPES=(
+  ("habitat",dict,"habitat must be an object"),
+  ("globals",dict,"globals must be an object"),
+  ("agents",dict,"agents must be an object"),
+  ("apply",bool,"apply must be a boolean"),
+)
+_MISSING=object()
+
 def validate_config_upload(data):
   """Validate config upload request data."""
   errors=[]
-  if "habitat" in data and not isinstance(data["habitat"],dict):errors.append("habitat must be an object")
-  if "globals" in data and not isinstance(data["globals"],dict):errors.append("globals must be an object")
-  if "agents" in data and not isinstance(data["agents"],dict):errors.append("agents must be an object")
-  if "globals" in data and not isinstance(data["globals"],dict):errors.append("globals must be an object")
-  if "apply" in data and not isinstance(data["apply"],bool):errors.append("apply must be a boolean")
+  for key,expected,msg in _UPLOAD_FIELD_TYPES:
+    value=data.get(key,_MISSING)
+    if value is not _MISSING and not isinstance(value,expected):errors.append(msg)
   return errors
 
 # Valid global fields that can be merged into habitat
@@ -134,12 +150,26 @@ def merge_globals_into_habitat(globals_data):
     return {"ok":False,"error":f"Failed to write merged habitat: {e}"}
 
 def write_config_file(path,data):
-  """Write config data to file with secure permissions."""
+  """Write config data to file with secure permissions.
+  
+  Writes to path+'.tmp' (created 0600), fsyncs, then renames over path, so a
+  crash mid-upload never leaves a truncated config for apply-config to pick up.
+  """
+  tmp=path+'.tmp'
   try:
-    with open(path,'w') as f:json.dump(data,f,indent=2)
-    os.chmod(path,0o600)
+    payload=memoryview(_dump_config(data))
+    fd=os.open(tmp,os.O_WRONLY|os.O_CREAT|os.O_TRUNC,0o600)
+    try:
+      os.fchmod(fd,0o600)
+      while payload:payload=payload[os.write(fd,payload):]
+      os.fsync(fd)
+    finally:os.close(fd)
+    os.replace(tmp,path)
     return {"ok":True,"path":path}
-  except Exception as e:return {"ok":False,"error":str(e)}
+  except Exception as e:
+    try:os.unlink(tmp)
+    except OSError:pass
+    return {"ok":False,"error":str(e)}
 
 def write_upload_marker():
   """Write API upload marker with timestamp.
@@ -173,7 +203,8 @@ def write_upload_marker():
   since upload status can still be determined via API (file existence check).
   
   Returns:
-    dict: {"ok": bool, "path": str, "error": str (if failed)}
+    dict: {"ok": bool, "path": str, "timestamp": float (written value, if ok),
+           "error": str (if failed)}
   """
   import sys
   timestamp = time.time()
@@ -192,7 +223,7 @@ def write_upload_marker():
     })
     print(log_entry, file=sys.stderr)
     
-    return {"ok": True, "path": MARKER_PATH}
+    return {"ok": True, "path": MARKER_PATH, "timestamp": timestamp}
     
   except PermissionError as e:
     error_msg = f"Permission denied writing marker: {e}"
@@ -260,8 +291,8 @@ def get_config_status():
     dict: {
       "habitat_exists": bool,
       "agents_exists": bool,
-      "habitat_modified": float (mtime, if exists),
-      "agents_modified": float (mtime, if exists),
+      "habitat_modified_ns": int (mtime in ns since epoch, if exists),
+      "agents_modified_ns": int (mtime in ns since epoch, if exists),
       "habitat_name": str (if exists),
       "habitat_agent_count": int (if exists),
       "agents_names": list[str] (if exists),
@@ -269,28 +300,36 @@ def get_config_status():
       "api_uploaded_at": float (timestamp, if api_uploaded)
     }
   """
-  result={"habitat_exists":os.path.exists(HABITAT_PATH),"agents_exists":os.path.exists(AGENTS_PATH)}
-  if result["habitat_exists"]:
-    stat=os.stat(HABITAT_PATH);result["habitat_modified"]=stat.st_mtime
+  # One stat per file: a failed stat is what os.path.exists reports as False
+  try:habitat_stat=os.stat(HABITAT_PATH)
+  except OSError:habitat_stat=None
+  try:agents_stat=os.stat(AGENTS_PATH)
+  except OSError:agents_stat=None
+  result={"habitat_exists":habitat_stat is not None,"agents_exists":agents_stat is not None}
+  if habitat_stat is not None:
+    result["habitat_modified_ns"]=habitat_stat.st_mtime_ns
     try:
       with open(HABITAT_PATH,'r') as f:h=json.load(f)
       result["habitat_name"]=h.get("name","")
       result["habitat_agent_count"]=len(h.get("agents",[]))
     except:pass
-  if result["agents_exists"]:
-    stat=os.stat(AGENTS_PATH);result["agents_modified"]=stat.st_mtime
+  if agents_stat is not None:
+    result["agents_modified_ns"]=agents_stat.st_mtime_ns
     try:
       with open(AGENTS_PATH,'r') as f:a=json.load(f)
       result["agents_names"]=list(a.keys())
     except:pass
-  # Check API upload marker (issue #115)
-  if os.path.exists(MARKER_PATH):
+  # Check API upload marker (issue #115). Only a missing marker means
+  # "not uploaded"; an unreadable one still counts as uploaded.
+  try:
+    marker=_read_marker()
+  except Exception:
     result["api_uploaded"]=True
-    try:
-      with open(MARKER_PATH,'r') as f:result["api_uploaded_at"]=float(f.read().strip())
-    except:pass
   else:
-    result["api_uploaded"]=False
+    result["api_uploaded"]=marker is not None
+    if marker is not None:
+      try:result["api_uploaded_at"]=float(marker.strip())
+      except ValueError:pass
   return result
 
 def get_config_upload_status():
@@ -313,15 +352,33 @@ def get_config_upload_status():
     }
   """
   result={"api_uploaded":False,"api_uploaded_at":None}
-  if os.path.exists(MARKER_PATH):
+  try:marker=_read_marker()
+  except Exception:
+    result["api_uploaded"]=True;return result
+  if marker is not None:
     result["api_uploaded"]=True
-    try:
-      with open(MARKER_PATH,'r') as f:result["api_uploaded_at"]=float(f.read().strip())
-    except:pass
+    try:result["api_uploaded_at"]=float(marker.strip())
+    except ValueError:pass
   return result
 
+def _read_marker():
+  """Return the contents of MARKER_PATH, or None if there is no marker.
+
+  Errors other than a missing file propagate to the caller. The file is
+  opened per call: requests are served on separate threads, so there is no
+  shared fd to guard.
+  """
+  try:
+    with open(MARKER_PATH,'r') as f:return f.read()
+  except (FileNotFoundError,NotADirectoryError):return None
+
 def trigger_config_apply():
-  """Trigger config apply script asynchronously."""
+  """Trigger config apply script asynchronously.
+  
+  Popen already spawns via vfork+exec on Linux (Python 3.10+), so there is
+  no page-table copy to avoid; unlike a bare os.posix_spawn it also reaps the
+  child, which would otherwise linger as a zombie until the server restarts.
+  """
   try:subprocess.Popen([APPLY_SCRIPT]);return {"ok":True,"restarting":True}
   except Exception as e:return {"ok":False,"error":str(e)}
 
@@ -334,7 +391,7 @@ def verify_hmac_auth(timestamp_header, signature_header, method, path, body):
   - request body (integrity)
 
   Message format:
-    "{timestamp}.{method}.{path}.{body}" where body is UTF-8 JSON string.
+    "{timestamp}.{method}.{path}.{body}" where body is the raw request bytes.
 
   Returns:
     (bool, str|None): (success, error_message)
@@ -368,19 +425,45 @@ def verify_hmac_auth(timestamp_header, signature_header, method, path, body):
       return False, f"Timestamp from future: {abs(age)}s ahead (max 300s drift allowed)"
 
   # Verify signature
+  # Compare raw 32-byte digests; a header that is not 64 lowercase hex chars
+  # cannot match (signatures are case-sensitive), so it is rejected before
+  # hashing the body
   try:
-    b = body.decode('utf-8') if isinstance(body, (bytes, bytearray)) else (body or '')
-    msg = f"{timestamp}.{method}.{path}.{b}"
-    expected_sig = hmac.new(API_SECRET.encode(), msg.encode(), hashlib.sha256).hexdigest()
-    if hmac.compare_digest(signature_header, expected_sig):
+    well_formed = len(signature_header) == 64 and signature_header == signature_header.lower()
+    provided_sig = bytes.fromhex(signature_header) if well_formed else None
+  except ValueError:
+    provided_sig = None
+  if provided_sig is None:
+    return False, "Signature mismatch (X-Signature must be a 64-char lowercase hex HMAC-SHA256)"
+
+  # The body is signed as raw bytes; only the short header prefix is encoded
+  try:
+    if isinstance(body, str):
+      body = body.encode()
+    msg = f"{timestamp}.{method}.{path}.".encode() + (body or b'')
+    expected_sig = _hmac_sha256(msg)
+    if hmac.compare_digest(provided_sig, expected_sig):
       return True, None
     else:
       return False, "Signature mismatch (check API_SECRET and message format)"
-  except UnicodeDecodeError as e:
-    return False, f"Body encoding error: {e}"
   except Exception as e:
     return False, f"Signature verification failed: {e}"
 
+# HMAC-SHA256 keyed with API_SECRET, built once: the key pads are hashed at
+# construction, so each request only copies this and hashes its message.
+# Tracks the secret it was built from so a changed API_SECRET rebuilds it.
+_hmac_template=(None,None)
+
+def _hmac_sha256(msg):
+  """Return the raw HMAC-SHA256 digest of msg (bytes) under API_SECRET."""
+  global _hmac_template
+  secret,template=_hmac_template
+  if template is None or secret!=API_SECRET:
+    template=hmac.new(API_SECRET.encode(),digestmod=hashlib.sha256)
+    _hmac_template=(API_SECRET,template)
+  h=template.copy();h.update(msg)
+  return h.digest()
+
 class H(http.server.BaseHTTPRequestHandler):
   def log_message(self,*a):pass
   
@@ -577,8 +660,8 @@ class H(http.server.BaseHTTPRequestHandler):
       # Support base64-encoded body (for iOS Shortcuts - avoids shell escaping issues)
       if 'base64' in content_type.lower():
         try:
-          # Strip whitespace (iOS may line-wrap at 76 chars)
-          body=base64.b64decode(body.replace(b'\n',b'').replace(b'\r',b'').replace(b' ',b''))
+          # Strip whitespace (iOS may line-wrap at 76 chars) in one pass
+          body=base64.b64decode(body.translate(None,b'\n\r '))
         except Exception as e:
           self.send_json(400,{"ok":False,"error":f"Invalid base64: {e}"});return
       
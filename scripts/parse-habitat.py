@@ -29,14 +29,64 @@
 #
 # Original: /usr/local/bin/parse-habitat.py (in hatch.yaml write_files)
 # =============================================================================
-import json, base64, os, sys, re
+import json, base64, binascii, os, sys, re
 
-def d(val):
-    try: return base64.b64decode(val).decode()
-    except: return ""
+# Prefer orjson for decoding when available; it accepts the decoded bytes
+# directly and is several times faster than the stdlib parser
+try:
+    import orjson
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj):
+        return json.dumps(obj, indent=2).encode()
+
+# Platform names, interned once so dict/set lookups hit the identity fast path
+_TELEGRAM = sys.intern("telegram")
+_DISCORD = sys.intern("discord")
+_BOTH = sys.intern("both")
+_VALID_PLATFORMS = frozenset((_TELEGRAM, _DISCORD, _BOTH))
+
+# Isolation levels and container network modes accepted in habitat/agent config
+_VALID_ISOLATION = frozenset(("none", "session", "container", "droplet"))
+_VALID_NETWORK = frozenset(("host", "internal", "none"))
+# Isolation levels where the agent network mode takes effect
+_NETWORKED_ISOLATION = frozenset(("container", "droplet"))
+
+# Upper bounds on encoded input size; real configs are a few KB, so anything
+# larger is rejected before base64 decoding allocates it
+_MAX_HAB_B64 = 4 * 1024 * 1024
+_MAX_LIB_B64 = 16 * 1024 * 1024
 
 def b64(s):
-    return base64.b64encode((s or "").encode()).decode()
+    # Empty/None fields are common (unset globals, missing tokens); skip the
+    # encode round trip since base64 of "" is ""
+    if not s:
+        return ""
+    # b2a_base64 is the C primitive behind base64.b64encode, minus the wrapper
+    return binascii.b2a_base64(s.encode(), newline=False).decode('ascii')
+
+def write_atomic(path, data, mode=0o600):
+    """Write bytes to path via a temp file and rename.
+
+    An interrupted boot must never leave a truncated config behind, so the
+    payload goes to path + '.tmp', is fsynced, and then replaces path.
+    """
+    tmp = path + '.tmp'
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    try:
+        os.fchmod(fd, mode)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
 
 def is_valid_isolation_group(value):
     """Check if isolationGroup is valid (alphanumeric + hyphens only).
@@ -138,7 +188,7 @@ def validate_habitat_schema(hab):
         valid, err = validate_type(hab["platform"], str, "platform")
         if not valid:
             errors.append(err)
-        elif hab["platform"] not in ("telegram", "discord", "both"):
+        elif hab["platform"] not in _VALID_PLATFORMS:
             errors.append(f"'platform' must be 'telegram', 'discord', or 'both', got '{hab['platform']}'")
     
     # Optional: platforms (dict)
@@ -299,18 +349,61 @@ def validate_agent_schema(agent, index):
     
     return errors
 
+# Per-agent env block, parsed once and filled with a single % substitution
+# per agent once all of the agent's fields are resolved
+_AGENT_TEMPLATE = (
+    'AGENT%(n)d_NAME="%(name)s"\n'
+    'AGENT%(n)d_NAME_B64="%(name_b64)s"\n'
+    # Backward compat: BOT_TOKEN = telegram bot token
+    'AGENT%(n)d_BOT_TOKEN="%(tg_token)s"\n'
+    'AGENT%(n)d_BOT_TOKEN_B64="%(tg_token_b64)s"\n'
+    # Explicit per-platform tokens
+    'AGENT%(n)d_TELEGRAM_BOT_TOKEN="%(tg_token)s"\n'
+    'AGENT%(n)d_TELEGRAM_BOT_TOKEN_B64="%(tg_token_b64)s"\n'
+    'AGENT%(n)d_DISCORD_BOT_TOKEN="%(dc_token)s"\n'
+    'AGENT%(n)d_DISCORD_BOT_TOKEN_B64="%(dc_token_b64)s"\n'
+    'AGENT%(n)d_MODEL="%(model)s"\n'
+    'AGENT%(n)d_IDENTITY_B64="%(identity_b64)s"\n'
+    'AGENT%(n)d_SOUL_B64="%(soul_b64)s"\n'
+    'AGENT%(n)d_AGENTS_B64="%(agents_b64)s"\n'
+    'AGENT%(n)d_BOOT_B64="%(boot_b64)s"\n'
+    'AGENT%(n)d_BOOTSTRAP_B64="%(bootstrap_b64)s"\n'
+    'AGENT%(n)d_USER_B64="%(user_b64)s"\n'
+    # v3 isolation fields (TASK-201, TASK-202)
+    'AGENT%(n)d_ISOLATION_GROUP="%(isolation_group)s"\n'
+    'AGENT%(n)d_ISOLATION="%(isolation)s"\n'
+    'AGENT%(n)d_NETWORK="%(network)s"\n'
+    'AGENT%(n)d_CAPABILITIES="%(capabilities)s"\n'
+    'AGENT%(n)d_RESOURCES_MEMORY="%(resources_memory)s"\n'
+    'AGENT%(n)d_RESOURCES_CPU="%(resources_cpu)s"\n'
+)
+
 # =============================================================================
 # Main Script
 # =============================================================================
-hab_raw = os.environ.get('HABITAT_B64', '')
-lib_raw = os.environ.get('AGENT_LIB_B64', '')
+# Read the encoded blobs as bytes so b64decode skips its str -> ASCII copy;
+# the decoded bytes then go straight to the JSON parser. Line breaks and
+# spaces (base64 tools wrap at 76 columns) are stripped before the strict
+# decode, as the API upload path does.
+hab_raw = os.environb.get(b'HABITAT_B64', b'')
+lib_raw = os.environb.get(b'AGENT_LIB_B64', b'')
 
 if not hab_raw:
     print("ERROR: HABITAT_B64 not set", file=sys.stderr)
     sys.exit(1)
 
+if len(hab_raw) > _MAX_HAB_B64:
+    print("ERROR: HABITAT_B64 too large ({} bytes, max {})".format(len(hab_raw), _MAX_HAB_B64), file=sys.stderr)
+    sys.exit(1)
+
 try:
-    hab = json.loads(d(hab_raw))
+    hab_json = base64.b64decode(hab_raw.translate(None, b'\n\r '), validate=True)
+except binascii.Error as e:
+    print("ERROR: HABITAT_B64 is not valid base64: {}".format(e), file=sys.stderr)
+    sys.exit(1)
+
+try:
+    hab = _json_loads(hab_json)
 except (json.JSONDecodeError, Exception) as e:
     print("ERROR: Failed to parse HABITAT_B64: {}".format(e), file=sys.stderr)
     sys.exit(1)
@@ -324,9 +417,13 @@ if validation_errors:
     sys.exit(1)
 
 lib = {}
-if lib_raw:
+if len(lib_raw) > _MAX_LIB_B64:
+    print("WARN: AGENT_LIB_B64 too large ({} bytes, max {}), using empty library".format(len(lib_raw), _MAX_LIB_B64), file=sys.stderr)
+elif lib_raw:
     try:
-        lib = json.loads(d(lib_raw))
+        lib = _json_loads(base64.b64decode(lib_raw.translate(None, b'\n\r '), validate=True))
+    except binascii.Error:
+        print("WARN: AGENT_LIB_B64 is not valid base64, using empty library", file=sys.stderr)
     except (json.JSONDecodeError, Exception):
         print("WARN: Failed to parse AGENT_LIB_B64, using empty library", file=sys.stderr)
     else:
@@ -338,12 +435,7 @@ if lib_raw:
 # Output directory: /etc by default, override with HABITAT_OUTPUT_DIR for testing
 output_dir = os.environ.get('HABITAT_OUTPUT_DIR', '/etc')
 
-with open(os.path.join(output_dir, 'habitat.json'), 'w') as f:
-    json.dump(hab, f, indent=2)
-os.chmod(os.path.join(output_dir, 'habitat.json'), 0o600)
-
-# Track deprecation warnings to emit at end
-deprecation_warnings = []
+write_atomic(os.path.join(output_dir, 'habitat.json'), _json_dumps(hab))
 
 # Helper: get platform config with v2/v1 fallback
 def get_platform_config(hab, platform_name):
@@ -353,9 +445,10 @@ def get_platform_config(hab, platform_name):
         return platforms[platform_name]
     # v1 fallback: top-level discord/telegram
     if platform_name in hab:
-        deprecation_warnings.append(
+        print(
             f"DEPRECATION: Top-level '{platform_name}' is v1 schema. "
-            f"Use 'platforms.{platform_name}' instead. See issue #112."
+            f"Use 'platforms.{platform_name}' instead. See issue #112.",
+            file=sys.stderr,
         )
         return hab[platform_name]
     return {}
@@ -371,257 +464,258 @@ def normalize_agent_ref(agent_ref):
         return {"agent": agent_ref}
     return agent_ref
 
-# Helper: get agent token with v2/v1 fallback
-def get_agent_token(agent_ref, platform_name, agent_name=""):
-    """Get agent token: v2 (tokens.X) or v1 (XBotToken) format.
-    
-    Returns empty string for missing or null tokens (never None).
-    """
-    tokens = agent_ref.get("tokens", {})
-    if platform_name in tokens:
-        # Normalize null to empty string to avoid "None" in env vars
-        return tokens[platform_name] or ""
-    # v1 fallback: discordBotToken, telegramBotToken, botToken
-    if platform_name == "discord":
-        if "discordBotToken" in agent_ref:
-            deprecation_warnings.append(
-                f"DEPRECATION: Agent '{agent_name}' uses 'discordBotToken' (v1 schema). "
-                f"Use 'tokens.discord' instead. See issue #112."
-            )
-            return agent_ref["discordBotToken"]
-    elif platform_name == "telegram":
-        if "telegramBotToken" in agent_ref:
-            deprecation_warnings.append(
-                f"DEPRECATION: Agent '{agent_name}' uses 'telegramBotToken' (v1 schema). "
-                f"Use 'tokens.telegram' instead. See issue #112."
-            )
-            return agent_ref["telegramBotToken"]
-        if "botToken" in agent_ref:
-            deprecation_warnings.append(
-                f"DEPRECATION: Agent '{agent_name}' uses 'botToken' (v1 schema). "
-                f"Use 'tokens.telegram' instead. See issue #112."
-            )
-            return agent_ref["botToken"]
-    return ""
-
-with open(os.path.join(output_dir, 'habitat-parsed.env'), 'w') as f:
-    f.write('HABITAT_NAME="{}"\n'.format(hab["name"]))
-    f.write('HABITAT_NAME_B64="{}"\n'.format(b64(hab["name"])))
-    f.write('DESTRUCT_MINS="{}"\n'.format(hab.get("destructMinutes", 0)))
-    f.write('DESTRUCT_MINS_B64="{}"\n'.format(b64(str(hab.get("destructMinutes", 0)))))
-    f.write('BG_COLOR="{}"\n'.format(hab.get("bgColor", "2D3748")))
-
-    # Platform (default: "telegram" for backward compat)
-    platform = hab.get("platform", "telegram")
-    f.write('PLATFORM="{}"\n'.format(platform))
-    f.write('PLATFORM_B64="{}"\n'.format(b64(platform)))
-
-    # Discord config (v2: platforms.discord, v1: discord)
-    discord_cfg = get_platform_config(hab, "discord")
-    f.write('DISCORD_GUILD_ID="{}"\n'.format(discord_cfg.get("serverId", "")))
-    f.write('DISCORD_GUILD_ID_B64="{}"\n'.format(b64(discord_cfg.get("serverId", ""))))
-    f.write('DISCORD_OWNER_ID="{}"\n'.format(discord_cfg.get("ownerId", "")))
-    f.write('DISCORD_OWNER_ID_B64="{}"\n'.format(b64(discord_cfg.get("ownerId", ""))))
-
-    # Telegram config (v2: platforms.telegram, v1: telegram)
-    telegram_cfg = get_platform_config(hab, "telegram")
-    telegram_owner_id = telegram_cfg.get("ownerId", "")
-    f.write('TELEGRAM_OWNER_ID="{}"\n'.format(telegram_owner_id))
-    f.write('TELEGRAM_OWNER_ID_B64="{}"\n'.format(b64(telegram_owner_id)))
-    # Backward compat: keep TELEGRAM_USER_ID_B64 as alias
-    f.write('TELEGRAM_USER_ID_B64="{}"\n'.format(b64(telegram_owner_id)))
-
-    # Council config (supports nested telegram.groupId and legacy groupId)
-    council = hab.get("council", {})
-    council_tg = council.get("telegram", {})
-    council_group_id = council_tg.get("groupId", council.get("groupId", hab.get("councilGroupId", "")))
-    f.write('COUNCIL_GROUP_ID="{}"\n'.format(council_group_id))
-    f.write('COUNCIL_GROUP_NAME="{}"\n'.format(council.get("groupName", "")))
-    f.write('COUNCIL_JUDGE="{}"\n'.format(council.get("judge", "")))
-    f.write('HABITAT_DOMAIN="{}"\n'.format(hab.get("domain", "")))
-
-    # API server bind address
-    # Priority: 1. apiBindAddress (explicit override)
-    #           2. remoteApi boolean (user-friendly flag)
-    #           3. Default: 127.0.0.1 (secure-by-default)
-    if "apiBindAddress" in hab:
-        api_bind = hab["apiBindAddress"]
-    elif hab.get("remoteApi", False):
-        api_bind = "0.0.0.0"  # Remote access enabled
+# Build the env file in memory and write it with a single call
+env_parts = []
+append = env_parts.append
+
+destruct_mins = hab.get("destructMinutes", 0)
+append(f'HABITAT_NAME="{hab["name"]}"\n')
+append(f'HABITAT_NAME_B64="{b64(hab["name"])}"\n')
+append(f'DESTRUCT_MINS="{destruct_mins}"\n')
+append(f'DESTRUCT_MINS_B64="{b64(str(destruct_mins))}"\n')
+append(f'BG_COLOR="{hab.get("bgColor", "2D3748")}"\n')
+
+# Platform (default: "telegram" for backward compat)
+platform = hab.get("platform", _TELEGRAM)
+append(f'PLATFORM="{platform}"\n')
+append(f'PLATFORM_B64="{b64(platform)}"\n')
+
+# Discord config (v2: platforms.discord, v1: discord)
+discord_cfg = get_platform_config(hab, _DISCORD)
+discord_guild_id = discord_cfg.get("serverId", "")
+discord_owner_id = discord_cfg.get("ownerId", "")
+append(f'DISCORD_GUILD_ID="{discord_guild_id}"\n')
+append(f'DISCORD_GUILD_ID_B64="{b64(discord_guild_id)}"\n')
+append(f'DISCORD_OWNER_ID="{discord_owner_id}"\n')
+append(f'DISCORD_OWNER_ID_B64="{b64(discord_owner_id)}"\n')
+
+# Telegram config (v2: platforms.telegram, v1: telegram)
+telegram_cfg = get_platform_config(hab, _TELEGRAM)
+telegram_owner_id = telegram_cfg.get("ownerId", "")
+telegram_owner_id_b64 = b64(telegram_owner_id)
+append(f'TELEGRAM_OWNER_ID="{telegram_owner_id}"\n')
+append(f'TELEGRAM_OWNER_ID_B64="{telegram_owner_id_b64}"\n')
+# Backward compat: keep TELEGRAM_USER_ID_B64 as alias
+append(f'TELEGRAM_USER_ID_B64="{telegram_owner_id_b64}"\n')
+
+# Council config (supports nested telegram.groupId and legacy groupId)
+council = hab.get("council", {})
+council_tg = council.get(_TELEGRAM, {})
+council_group_id = council_tg.get("groupId", council.get("groupId", hab.get("councilGroupId", "")))
+append(f'COUNCIL_GROUP_ID="{council_group_id}"\n')
+append(f'COUNCIL_GROUP_NAME="{council.get("groupName", "")}"\n')
+append(f'COUNCIL_JUDGE="{council.get("judge", "")}"\n')
+append(f'HABITAT_DOMAIN="{hab.get("domain", "")}"\n')
+
+# API server bind address
+# Priority: 1. apiBindAddress (explicit override)
+#           2. remoteApi boolean (user-friendly flag)
+#           3. Default: 127.0.0.1 (secure-by-default)
+if "apiBindAddress" in hab:
+    api_bind = hab["apiBindAddress"]
+elif hab.get("remoteApi", False):
+    api_bind = "0.0.0.0"  # Remote access enabled
+else:
+    api_bind = "127.0.0.1"  # Secure default
+append(f'API_BIND_ADDRESS="{api_bind}"\n')
+
+append(f'GLOBAL_IDENTITY_B64="{b64(hab.get("globalIdentity", ""))}"\n')
+append(f'GLOBAL_BOOT_B64="{b64(hab.get("globalBoot", ""))}"\n')
+append(f'GLOBAL_BOOTSTRAP_B64="{b64(hab.get("globalBootstrap", ""))}"\n')
+append(f'GLOBAL_SOUL_B64="{b64(hab.get("globalSoul", ""))}"\n')
+append(f'GLOBAL_AGENTS_B64="{b64(hab.get("globalAgents", ""))}"\n')
+append(f'GLOBAL_USER_B64="{b64(hab.get("globalUser", ""))}"\n')
+append(f'GLOBAL_TOOLS_B64="{b64(hab.get("globalTools", ""))}"\n')
+
+# v3 Isolation settings (TASK-201, TASK-202)
+# Default isolation level for all agents
+isolation_default = hab.get("isolation", "none")
+if isolation_default == "droplet":
+    print("ERROR: droplet isolation mode is not yet supported", file=sys.stderr)
+    sys.exit(1)
+if isolation_default not in _VALID_ISOLATION:
+    print(f"WARN: Invalid isolation level '{isolation_default}', defaulting to 'none'", file=sys.stderr)
+    isolation_default = "none"
+append(f'ISOLATION_DEFAULT="{isolation_default}"\n')
+
+# Shared paths for cross-boundary access
+shared_paths = hab.get("sharedPaths", [])
+# Ensure sharedPaths is a list of strings; warn and default safely otherwise
+if not isinstance(shared_paths, list):
+    print(f"WARN: sharedPaths must be a list; got {type(shared_paths).__name__}, defaulting to empty list", file=sys.stderr)
+    shared_paths_normalized = []
+else:
+    shared_paths_normalized = []
+    for idx, p in enumerate(shared_paths):
+        if p is None:
+            print(f"WARN: sharedPaths[{idx}] is None; skipping", file=sys.stderr)
+            continue
+        try:
+            shared_paths_normalized.append(str(p))
+        except Exception as e:
+            print(f"WARN: sharedPaths[{idx}] could not be converted to string ({e}); skipping", file=sys.stderr)
+append(f'ISOLATION_SHARED_PATHS="{",".join(shared_paths_normalized)}"\n')
+
+agents = hab.get("agents", [])
+append(f'AGENT_COUNT={len(agents)}\n')
+
+# Track unique isolation groups for ISOLATION_GROUPS output
+isolation_groups = set()
+
+for i, raw_agent_ref in enumerate(agents):
+    n = i + 1
+    agent_ref = normalize_agent_ref(raw_agent_ref)
+    name = agent_ref["agent"]
+    lib_entry = lib.get(name, {})
+    model = agent_ref.get("model") or lib_entry.get("model", "anthropic/claude-opus-4-5")
+    identity = lib_entry.get("identity", "")
+    soul = lib_entry.get("soul", "")
+    agents_md = lib_entry.get("agents", "")
+    boot = lib_entry.get("boot", "")
+    bootstrap = lib_entry.get("bootstrap", "")
+    user = lib_entry.get("user", "")
+
+    # Get tokens (v2: tokens.X, v1: XBotToken). A tokens.X entry wins even
+    # when null; null is normalized to "" to avoid "None" in env vars.
+    tokens = agent_ref.get("tokens") or {}
+    if _TELEGRAM in tokens:
+        tg_bot_token = tokens[_TELEGRAM] or ""
+    elif "telegramBotToken" in agent_ref:
+        print(
+            f"DEPRECATION: Agent '{name}' uses 'telegramBotToken' (v1 schema). "
+            f"Use 'tokens.telegram' instead. See issue #112.",
+            file=sys.stderr,
+        )
+        tg_bot_token = agent_ref["telegramBotToken"]
+    elif "botToken" in agent_ref:
+        print(
+            f"DEPRECATION: Agent '{name}' uses 'botToken' (v1 schema). "
+            f"Use 'tokens.telegram' instead. See issue #112.",
+            file=sys.stderr,
+        )
+        tg_bot_token = agent_ref["botToken"]
     else:
-        api_bind = "127.0.0.1"  # Secure default
-    f.write('API_BIND_ADDRESS="{}"\n'.format(api_bind))
-
-    f.write('GLOBAL_IDENTITY_B64="{}"\n'.format(b64(hab.get("globalIdentity", ""))))
-    f.write('GLOBAL_BOOT_B64="{}"\n'.format(b64(hab.get("globalBoot", ""))))
-    f.write('GLOBAL_BOOTSTRAP_B64="{}"\n'.format(b64(hab.get("globalBootstrap", ""))))
-    f.write('GLOBAL_SOUL_B64="{}"\n'.format(b64(hab.get("globalSoul", ""))))
-    f.write('GLOBAL_AGENTS_B64="{}"\n'.format(b64(hab.get("globalAgents", ""))))
-    f.write('GLOBAL_USER_B64="{}"\n'.format(b64(hab.get("globalUser", ""))))
-    f.write('GLOBAL_TOOLS_B64="{}"\n'.format(b64(hab.get("globalTools", ""))))
-
-    # v3 Isolation settings (TASK-201, TASK-202)
-    # Default isolation level for all agents
-    isolation_default = hab.get("isolation", "none")
-    valid_isolation_levels = ["none", "session", "container", "droplet"]
-    if isolation_default == "droplet":
-        print("ERROR: droplet isolation mode is not yet supported", file=sys.stderr)
-        sys.exit(1)
-    if isolation_default not in valid_isolation_levels:
-        print(f"WARN: Invalid isolation level '{isolation_default}', defaulting to 'none'", file=sys.stderr)
-        isolation_default = "none"
-    f.write('ISOLATION_DEFAULT="{}"\n'.format(isolation_default))
-
-    # Shared paths for cross-boundary access
-    shared_paths = hab.get("sharedPaths", [])
-    # Ensure sharedPaths is a list of strings; warn and default safely otherwise
-    if not isinstance(shared_paths, list):
-        print(f"WARN: sharedPaths must be a list; got {type(shared_paths).__name__}, defaulting to empty list", file=sys.stderr)
-        shared_paths_normalized = []
+        tg_bot_token = ""
+    if _DISCORD in tokens:
+        dc_bot_token = tokens[_DISCORD] or ""
+    elif "discordBotToken" in agent_ref:
+        print(
+            f"DEPRECATION: Agent '{name}' uses 'discordBotToken' (v1 schema). "
+            f"Use 'tokens.discord' instead. See issue #112.",
+            file=sys.stderr,
+        )
+        dc_bot_token = agent_ref["discordBotToken"]
     else:
-        shared_paths_normalized = []
-        for idx, p in enumerate(shared_paths):
-            if p is None:
-                print(f"WARN: sharedPaths[{idx}] is None; skipping", file=sys.stderr)
-                continue
-            try:
-                shared_paths_normalized.append(str(p))
-            except Exception as e:
-                print(f"WARN: sharedPaths[{idx}] could not be converted to string ({e}); skipping", file=sys.stderr)
-    f.write('ISOLATION_SHARED_PATHS="{}"\n'.format(",".join(shared_paths_normalized)))
-
-    agents = hab.get("agents", [])
-    f.write('AGENT_COUNT={}\n'.format(len(agents)))
-
-    # Track unique isolation groups for ISOLATION_GROUPS output
-    isolation_groups = set()
-
-    for i, raw_agent_ref in enumerate(agents):
-        n = i + 1
-        agent_ref = normalize_agent_ref(raw_agent_ref)
-        name = agent_ref["agent"]
-        lib_entry = lib.get(name, {})
-        model = agent_ref.get("model") or lib_entry.get("model", "anthropic/claude-opus-4-5")
-        identity = lib_entry.get("identity", "")
-        soul = lib_entry.get("soul", "")
-        agents_md = lib_entry.get("agents", "")
-        boot = lib_entry.get("boot", "")
-        bootstrap = lib_entry.get("bootstrap", "")
-        user = lib_entry.get("user", "")
-
-        # Get tokens (v2: tokens.X, v1: XBotToken)
-        tg_bot_token = get_agent_token(agent_ref, "telegram", name)
-        dc_bot_token = get_agent_token(agent_ref, "discord", name)
-
-        f.write('AGENT{}_NAME="{}"\n'.format(n, name))
-        f.write('AGENT{}_NAME_B64="{}"\n'.format(n, b64(name)))
-        # Backward compat: BOT_TOKEN = telegram bot token
-        f.write('AGENT{}_BOT_TOKEN="{}"\n'.format(n, tg_bot_token))
-        f.write('AGENT{}_BOT_TOKEN_B64="{}"\n'.format(n, b64(tg_bot_token)))
-        # Explicit per-platform tokens
-        f.write('AGENT{}_TELEGRAM_BOT_TOKEN="{}"\n'.format(n, tg_bot_token))
-        f.write('AGENT{}_TELEGRAM_BOT_TOKEN_B64="{}"\n'.format(n, b64(tg_bot_token)))
-        f.write('AGENT{}_DISCORD_BOT_TOKEN="{}"\n'.format(n, dc_bot_token))
-        f.write('AGENT{}_DISCORD_BOT_TOKEN_B64="{}"\n'.format(n, b64(dc_bot_token)))
-        f.write('AGENT{}_MODEL="{}"\n'.format(n, model))
-        f.write('AGENT{}_IDENTITY_B64="{}"\n'.format(n, b64(identity)))
-        f.write('AGENT{}_SOUL_B64="{}"\n'.format(n, b64(soul)))
-        f.write('AGENT{}_AGENTS_B64="{}"\n'.format(n, b64(agents_md)))
-        f.write('AGENT{}_BOOT_B64="{}"\n'.format(n, b64(boot)))
-        f.write('AGENT{}_BOOTSTRAP_B64="{}"\n'.format(n, b64(bootstrap)))
-        f.write('AGENT{}_USER_B64="{}"\n'.format(n, b64(user)))
-
-        # v3 Per-agent isolation fields (TASK-201, TASK-202)
-        # isolationGroup: agents in same group share isolation boundary
-        raw_isolation_group = agent_ref.get("isolationGroup", "")
-        if raw_isolation_group:
-            # User specified an isolationGroup, validate it
-            if not is_valid_isolation_group(raw_isolation_group):
-                sanitized_name = sanitize_isolation_group(name)
-                # Check if it's a type error (non-string complex type)
-                if isinstance(raw_isolation_group, (dict, list, tuple, set)):
-                    print(
-                        f"WARN: Agent '{name}' has invalid isolationGroup type '{type(raw_isolation_group).__name__}' "
-                        f"(must be a string); falling back to '{sanitized_name}'",
-                        file=sys.stderr
-                    )
-                else:
-                    print(
-                        f"WARN: Agent '{name}' has invalid isolationGroup '{raw_isolation_group}' "
-                        f"(must be alphanumeric + hyphens); falling back to '{sanitized_name}'",
-                        file=sys.stderr
-                    )
-                agent_isolation_group = sanitized_name
+        dc_bot_token = ""
+
+    # v3 Per-agent isolation fields (TASK-201, TASK-202)
+    # isolationGroup: agents in same group share isolation boundary
+    raw_isolation_group = agent_ref.get("isolationGroup", "")
+    if raw_isolation_group:
+        # User specified an isolationGroup, validate it
+        if not is_valid_isolation_group(raw_isolation_group):
+            sanitized_name = sanitize_isolation_group(name)
+            # Check if it's a type error (non-string complex type)
+            if isinstance(raw_isolation_group, (dict, list, tuple, set)):
+                print(
+                    f"WARN: Agent '{name}' has invalid isolationGroup type '{type(raw_isolation_group).__name__}' "
+                    f"(must be a string); falling back to '{sanitized_name}'",
+                    file=sys.stderr
+                )
             else:
-                # Valid but may need string coercion
-                if not isinstance(raw_isolation_group, str):
-                    agent_isolation_group = str(raw_isolation_group)
-                else:
-                    agent_isolation_group = raw_isolation_group
-        else:
-            # No isolationGroup specified, default to sanitized agent name
-            agent_isolation_group = sanitize_isolation_group(name)
-        f.write('AGENT{}_ISOLATION_GROUP="{}"\n'.format(n, agent_isolation_group))
-
-        # isolation: override global isolation level for this agent
-        agent_isolation = agent_ref.get("isolation", "")  # Empty = inherit global
-        if agent_isolation == "droplet":
-            print("ERROR: droplet isolation mode is not yet supported", file=sys.stderr)
-            sys.exit(1)
-        if agent_isolation and agent_isolation not in valid_isolation_levels:
-            print(f"WARN: Agent '{name}' has invalid isolation '{agent_isolation}', ignoring", file=sys.stderr)
-            agent_isolation = ""
-        f.write('AGENT{}_ISOLATION="{}"\n'.format(n, agent_isolation))
-
-        # network: container/droplet network mode (host, internal, none)
-        agent_network = agent_ref.get("network", "host")
-        valid_network_modes = ["host", "internal", "none"]
-        if agent_network not in valid_network_modes:
-            print(f"WARN: Agent '{name}' has invalid network '{agent_network}', defaulting to 'host'", file=sys.stderr)
-            agent_network = "host"
-        # Warn if network set for non-container/droplet isolation
-        effective_isolation = agent_isolation or isolation_default
-        if agent_network != "host" and effective_isolation not in ["container", "droplet"]:
-            print(f"WARN: Agent '{name}' has network='{agent_network}' but isolation='{effective_isolation}' (network only applies to container/droplet)", file=sys.stderr)
-        f.write('AGENT{}_NETWORK="{}"\n'.format(n, agent_network))
-
-        # capabilities: restrict tool access (empty = all tools)
-        agent_capabilities = agent_ref.get("capabilities", [])
-        if not isinstance(agent_capabilities, list):
-            print(
-                f"WARN: Agent '{name}' has non-list capabilities (type {type(agent_capabilities).__name__}); defaulting to []",
-                file=sys.stderr,
-            )
-            agent_capabilities = []
+                print(
+                    f"WARN: Agent '{name}' has invalid isolationGroup '{raw_isolation_group}' "
+                    f"(must be alphanumeric + hyphens); falling back to '{sanitized_name}'",
+                    file=sys.stderr
+                )
+            agent_isolation_group = sanitized_name
         else:
-            # Ensure all capabilities are strings before joining
-            agent_capabilities = [str(cap) for cap in agent_capabilities]
-        f.write('AGENT{}_CAPABILITIES="{}"\n'.format(n, ",".join(agent_capabilities)))
-
-        # resources: memory/cpu limits for container/droplet
-        agent_resources = agent_ref.get("resources", {})
-        if not isinstance(agent_resources, dict):
-            print(
-                f"WARN: Agent '{name}' has non-dict resources (type {type(agent_resources).__name__}); defaulting to {{}}",
-                file=sys.stderr,
-            )
-            agent_resources = {}
-        f.write('AGENT{}_RESOURCES_MEMORY="{}"\n'.format(n, agent_resources.get("memory", "")))
-        f.write('AGENT{}_RESOURCES_CPU="{}"\n'.format(n, agent_resources.get("cpu", "")))
-
-        # Track unique isolation groups — only when isolation is actually enabled.
-        # An agent is isolated if it has per-agent isolation set, or inherits a
-        # non-"none" global default.  Without this gate, ISOLATION_GROUPS gets
-        # populated for "none" mode habitats and build-full-config.sh runs
-        # per-group setup (manifest, dirs, env) for groups that will never be used.
-        effective_isolation = agent_isolation or isolation_default
-        if effective_isolation != "none":
-            isolation_groups.add(agent_isolation_group)
-
-    # List of unique isolation groups (only groups with actual isolation enabled)
-    f.write('ISOLATION_GROUPS="{}"\n'.format(",".join(sorted(isolation_groups))))
-
-os.chmod(os.path.join(output_dir, 'habitat-parsed.env'), 0o600)
+            # Valid but may need string coercion
+            if not isinstance(raw_isolation_group, str):
+                agent_isolation_group = str(raw_isolation_group)
+            else:
+                agent_isolation_group = raw_isolation_group
+    else:
+        # No isolationGroup specified, default to sanitized agent name
+        agent_isolation_group = sanitize_isolation_group(name)
+
+    # isolation: override global isolation level for this agent
+    agent_isolation = agent_ref.get("isolation", "")  # Empty = inherit global
+    if agent_isolation == "droplet":
+        print("ERROR: droplet isolation mode is not yet supported", file=sys.stderr)
+        sys.exit(1)
+    if agent_isolation and agent_isolation not in _VALID_ISOLATION:
+        print(f"WARN: Agent '{name}' has invalid isolation '{agent_isolation}', ignoring", file=sys.stderr)
+        agent_isolation = ""
+
+    # network: container/droplet network mode (host, internal, none)
+    agent_network = agent_ref.get("network", "host")
+    if agent_network not in _VALID_NETWORK:
+        print(f"WARN: Agent '{name}' has invalid network '{agent_network}', defaulting to 'host'", file=sys.stderr)
+        agent_network = "host"
+    # Warn if network set for non-container/droplet isolation
+    effective_isolation = agent_isolation or isolation_default
+    if agent_network != "host" and effective_isolation not in _NETWORKED_ISOLATION:
+        print(f"WARN: Agent '{name}' has network='{agent_network}' but isolation='{effective_isolation}' (network only applies to container/droplet)", file=sys.stderr)
+
+    # capabilities: restrict tool access (empty = all tools)
+    agent_capabilities = agent_ref.get("capabilities", [])
+    if not isinstance(agent_capabilities, list):
+        print(
+            f"WARN: Agent '{name}' has non-list capabilities (type {type(agent_capabilities).__name__}); defaulting to []",
+            file=sys.stderr,
+        )
+        agent_capabilities = []
+    else:
+        # Ensure all capabilities are strings before joining
+        agent_capabilities = [str(cap) for cap in agent_capabilities]
+
+    # resources: memory/cpu limits for container/droplet
+    agent_resources = agent_ref.get("resources", {})
+    if not isinstance(agent_resources, dict):
+        print(
+            f"WARN: Agent '{name}' has non-dict resources (type {type(agent_resources).__name__}); defaulting to {{}}",
+            file=sys.stderr,
+        )
+        agent_resources = {}
+
+    append(_AGENT_TEMPLATE % {
+        "n": n,
+        "name": name,
+        "name_b64": b64(name),
+        "tg_token": tg_bot_token,
+        "tg_token_b64": b64(tg_bot_token),
+        "dc_token": dc_bot_token,
+        "dc_token_b64": b64(dc_bot_token),
+        "model": model,
+        "identity_b64": b64(identity),
+        "soul_b64": b64(soul),
+        "agents_b64": b64(agents_md),
+        "boot_b64": b64(boot),
+        "bootstrap_b64": b64(bootstrap),
+        "user_b64": b64(user),
+        "isolation_group": agent_isolation_group,
+        "isolation": agent_isolation,
+        "network": agent_network,
+        "capabilities": ",".join(agent_capabilities),
+        "resources_memory": agent_resources.get("memory", ""),
+        "resources_cpu": agent_resources.get("cpu", ""),
+    })
+
+    # Track unique isolation groups — only when isolation is actually enabled.
+    # An agent is isolated if it has per-agent isolation set, or inherits a
+    # non-"none" global default.  Without this gate, ISOLATION_GROUPS gets
+    # populated for "none" mode habitats and build-full-config.sh runs
+    # per-group setup (manifest, dirs, env) for groups that will never be used.
+    effective_isolation = agent_isolation or isolation_default
+    if effective_isolation != "none":
+        isolation_groups.add(agent_isolation_group)
+
+# List of unique isolation groups (only groups with actual isolation enabled)
+append(f'ISOLATION_GROUPS="{",".join(sorted(isolation_groups))}"\n')
+
+write_atomic(os.path.join(output_dir, 'habitat-parsed.env'),
+             ''.join(env_parts).encode())
 
 # Write hatcheryVersion to /etc/hatchery-version (used by bootstrap.sh)
 # This allows habitat JSON to specify a feature branch for testing
@@ -633,10 +727,6 @@ with open(hatchery_version_path, 'w') as f:
     f.write(hatchery_version.strip())
 os.chmod(hatchery_version_path, 0o644)
 
-# Emit deprecation warnings
-for warning in deprecation_warnings:
-    print(warning, file=sys.stderr)
-
 # Show which branch is being used if not main
 branch_info = "" if hatchery_version == "main" else f" [branch: {hatchery_version}]"
 print("Parsed habitat '{}' with {} agents (platform: {}){}".format(hab['name'], len(agents), platform, branch_info))
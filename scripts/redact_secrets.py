@@ -9,8 +9,23 @@ Implements TASK-10: Secret redaction in logs and reports
 import re
 import json
 import os
+import sys
+import shutil
+import tempfile
 import threading
-from typing import Optional, Dict, List, Pattern
+from typing import Callable, Optional, Dict, Iterable, Iterator, List, Match, Pattern, Tuple
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    from re import _parser as _sre_parser, _constants as _sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse as _sre_parser
+    import sre_constants as _sre_constants
 
 
 # Default redaction patterns
@@ -110,29 +125,65 @@ DEFAULT_ALLOWLIST = [
     r'^TEST_SAFE_TOKEN_\d+$',  # Test tokens
 ]
 
-# Global config cache with TTL
+# Global config cache, keyed on the config file's path and stat signature
 _config_cache: Optional[Dict] = None
-_config_loaded_at: float = 0
-CONFIG_TTL_SECONDS = 300  # 5 minutes
+_config_key: Optional[Tuple] = None
 
 # Compiled regex patterns cache
 _compiled_patterns: Optional[List] = None
 
+# All patterns fused into one alternation, built with _compiled_patterns and
+# used only to detect text with nothing to redact. None when the configured
+# patterns cannot be fused.
+_fused_pattern: Optional[Pattern] = None
+
+# Compiled category buckets and allowlists per config dict, keyed by
+# id(config). Each entry holds the config itself: that keeps the id from
+# being reused while cached, and lets a lookup confirm it has the same dict.
+_bucket_cache: Dict[int, Tuple[Dict, Dict[str, List[Tuple[Pattern, str]]]]] = {}
+_allowlist_cache: Dict[int, Tuple[Dict, List[Tuple[Pattern, int, int]]]] = {}
+_MAX_CACHED_CONFIGS = 32
+
+# Numeric backreferences inside a pattern would be renumbered by fusing
+_PATTERN_BACKREF_RE = re.compile(r'\\[1-9]')
+
+# redact_file streaming: characters read per chunk, and the trailing window
+# held back between chunks. A match reaching into that window may still grow
+# once the next chunk arrives, so it is deferred; secrets are far shorter.
+REDACT_CHUNK_SIZE = 1024 * 1024
+REDACT_OVERLAP = 64 * 1024
+# Already-written text kept ahead of each chunk so \b and lookbehinds at the
+# chunk start see the same characters as in a whole-file pass
+_REDACT_LOOKBEHIND = 256
+
 # Thread safety lock for config loading
 _config_lock = threading.Lock()
 
 
 def invalidate_config_cache():
-    """Manually invalidate config cache. Useful for testing or config hot-reload."""
-    global _config_cache, _config_loaded_at, _compiled_patterns
+    """Manually invalidate config cache. Useful for testing."""
+    global _config_cache, _config_key, _compiled_patterns, _fused_pattern
     _config_cache = None
-    _config_loaded_at = 0
+    _config_key = None
     _compiled_patterns = None
+    _fused_pattern = None
+    _bucket_cache.clear()
+    _allowlist_cache.clear()
+
+
+def _config_file_key(config_path: str) -> Tuple:
+    """Cache key for a config file: its path plus mtime/inode/size, or None fields if missing."""
+    try:
+        st = os.stat(config_path)
+    except OSError:
+        return (config_path, None, None, None)
+    return (config_path, st.st_mtime_ns, st.st_ino, st.st_size)
 
 
 def load_redaction_config(config_path: Optional[str] = None) -> Dict:
     """
-    Load redaction configuration from file with TTL-based caching.
+    Load redaction configuration from file, cached until the file changes.
+    A cache hit costs one stat(); edits are picked up on the next call.
     Thread-safe using double-checked locking pattern.
     
     Args:
@@ -141,46 +192,45 @@ def load_redaction_config(config_path: Optional[str] = None) -> Dict:
     Returns:
         Dictionary with 'patterns', 'redaction_format', and 'allowlist' keys
     """
-    global _config_cache, _config_loaded_at, _compiled_patterns
-    import time
+    global _config_cache, _config_key, _compiled_patterns, _fused_pattern
+    
+    if config_path is None:
+        config_path = os.path.expanduser('~/clawd/shared/redaction-config.json')
     
-    now = time.time()
+    key = _config_file_key(config_path)
     
-    # Fast path: Check if cache is valid (exists and not expired) - no lock needed
-    if _config_cache is not None and (now - _config_loaded_at) < CONFIG_TTL_SECONDS:
+    # Fast path: file unchanged since it was loaded - no lock needed
+    if _config_cache is not None and _config_key == key:
         return _config_cache
     
     # Slow path: Acquire lock to load/reload config
     with _config_lock:
         # Double-check after acquiring lock (another thread may have loaded it)
-        if _config_cache is not None and (now - _config_loaded_at) < CONFIG_TTL_SECONDS:
+        if _config_cache is not None and _config_key == key:
             return _config_cache
         
-        # Cache expired or doesn't exist - invalidate compiled patterns too
+        # File changed or never loaded - invalidate compiled patterns too
         _compiled_patterns = None
-    
-    if config_path is None:
-        config_path = os.path.expanduser('~/clawd/shared/redaction-config.json')
-    
-    if os.path.exists(config_path):
-        try:
-            with open(config_path, 'r') as f:
-                config = json.load(f)
-                _config_cache = config
-                _config_loaded_at = now
-                return config
-        except Exception as e:
-            print(f"Warning: Failed to load config from {config_path}: {e}")
-    
-    # Return default config if file doesn't exist or fails to load
-    default_config = {
-        'patterns': DEFAULT_PATTERNS,
-        'redaction_format': '***REDACTED***',
-        'allowlist': DEFAULT_ALLOWLIST
-    }
-    _config_cache = default_config
-    _config_loaded_at = now
-    return default_config
+        _fused_pattern = None
+        
+        config = None
+        if key[1] is not None:
+            try:
+                with open(config_path, 'rb') as f:
+                    config = _json_loads(f.read())
+            except Exception as e:
+                print(f"Warning: Failed to load config from {config_path}: {e}")
+        
+        if config is None:
+            # Default config if file doesn't exist or fails to load
+            config = {
+                'patterns': DEFAULT_PATTERNS,
+                'redaction_format': '***REDACTED***',
+                'allowlist': DEFAULT_ALLOWLIST
+            }
+        _config_cache = config
+        _config_key = key
+        return config
 
 
 def _compile_patterns(config: Dict) -> List:
@@ -209,6 +259,150 @@ def _compile_patterns(config: Dict) -> List:
     return compiled
 
 
+def _fuse_patterns(config: Dict) -> Optional[Pattern]:
+    """
+    Combine all patterns into one alternation for a single-scan check.
+    
+    The fused pattern matches somewhere in a text exactly when at least one
+    configured pattern does, so text it does not match has nothing to
+    redact. It is never used for replacement: a leftmost-match alternation
+    would let an earlier-starting pattern (e.g. env_var_key's bounded value)
+    win over a higher-priority one and leave part of a secret behind.
+    
+    Args:
+        config: Configuration dictionary with patterns
+    
+    Returns:
+        Compiled alternation, or None if the patterns cannot be fused
+        (numeric backreferences inside a pattern, inline global flags,
+        duplicate group names)
+    """
+    parts = []
+    for pattern_def in config.get('patterns', DEFAULT_PATTERNS):
+        try:
+            regex_str = pattern_def['regex']
+            re.compile(regex_str, re.IGNORECASE)
+        except re.error:
+            # Already reported by _compile_patterns
+            continue
+        
+        if _PATTERN_BACKREF_RE.search(regex_str):
+            return None
+        parts.append(f'(?:{regex_str})')
+    
+    if not parts:
+        return None
+    
+    try:
+        return re.compile('|'.join(parts), re.IGNORECASE)
+    except re.error:
+        return None
+
+
+# Category helpers (redact_api_keys etc.) and the pattern-name substrings
+# that select patterns into each category
+_PATTERN_BUCKETS = {
+    'key': ('key',),
+    'token': ('token',),
+    'env_var': ('env_var',),
+    'auth': ('auth', 'bearer'),
+}
+
+
+def _pattern_bucket(config: Dict, bucket: str) -> List[Tuple[Pattern, str]]:
+    """
+    Return the compiled (pattern, replacement) list for one category helper.
+    
+    All buckets are compiled together on first use and cached per config
+    (in _bucket_cache, never on the dict itself), so the helpers no longer
+    filter and recompile patterns per call.
+    
+    Args:
+        config: Configuration dictionary with patterns
+        bucket: Key of _PATTERN_BUCKETS
+    
+    Returns:
+        List of tuples: (compiled_pattern, replacement_format)
+    """
+    cached = _bucket_cache.get(id(config))
+    if cached is not None and cached[0] is config:
+        return cached[1][bucket]
+    
+    buckets = {name: [] for name in _PATTERN_BUCKETS}
+    for pattern_def in config.get('patterns', DEFAULT_PATTERNS):
+        pattern_name = pattern_def.get('name', '').lower()
+        targets = [
+            name for name, needles in _PATTERN_BUCKETS.items()
+            if any(needle in pattern_name for needle in needles)
+        ]
+        if not targets:
+            continue
+        try:
+            compiled_pattern = re.compile(pattern_def['regex'])
+        except re.error as e:
+            print(f"Warning: Failed to compile pattern {pattern_def.get('name', 'unknown')}: {e}")
+            continue
+        replacement = pattern_def.get('format', '***REDACTED***')
+        for name in targets:
+            buckets[name].append((compiled_pattern, replacement))
+    if len(_bucket_cache) >= _MAX_CACHED_CONFIGS:
+        _bucket_cache.clear()
+    _bucket_cache[id(config)] = (config, buckets)
+    return buckets[bucket]
+
+
+def _allowlist_bounds(regex_str: str) -> Tuple[int, int]:
+    """
+    Length bounds of the (stripped) text an allowlist pattern can accept.
+    
+    The minimum is the pattern's shortest match. The maximum is only finite
+    when the whole pattern is end-anchored ($ or \\Z, not multiline), since
+    re.match otherwise accepts any longer text with a matching prefix.
+    
+    Args:
+        regex_str: Allowlist regex
+    
+    Returns:
+        Tuple of (min_len, max_len); (0, sys.maxsize) if unknown
+    """
+    try:
+        parsed = _sre_parser.parse(regex_str)
+        min_len, max_len = parsed.getwidth()
+        end_anchored = (
+            len(parsed) > 0
+            and parsed[-1][0] == _sre_constants.AT
+            and parsed[-1][1] in (_sre_constants.AT_END, _sre_constants.AT_END_STRING)
+            and not parsed.state.flags & _sre_constants.SRE_FLAG_MULTILINE
+        )
+    except Exception:
+        return 0, sys.maxsize
+    return min_len, (max_len if end_anchored else sys.maxsize)
+
+
+def _compile_allowlist(config: Dict) -> List[Tuple[Pattern, int, int]]:
+    """
+    Compile the config's allowlist once and cache it in _allowlist_cache.
+    
+    Args:
+        config: Configuration dictionary with allowlist
+    
+    Returns:
+        List of (compiled_pattern, min_len, max_len) tuples
+    """
+    cached = _allowlist_cache.get(id(config))
+    if cached is not None and cached[0] is config:
+        return cached[1]
+    
+    compiled = [
+        (re.compile(p),) + _allowlist_bounds(p)
+        for p in config.get('allowlist', DEFAULT_ALLOWLIST)
+    ]
+    if len(_allowlist_cache) >= _MAX_CACHED_CONFIGS:
+        _allowlist_cache.clear()
+    _allowlist_cache[id(config)] = (config, compiled)
+    return compiled
+
+
 def is_allowlisted(text: str, config: Optional[Dict] = None) -> bool:
     """
     Check if a string matches any allowlist pattern.
@@ -223,10 +417,11 @@ def is_allowlisted(text: str, config: Optional[Dict] = None) -> bool:
     if config is None:
         config = load_redaction_config()
     
-    allowlist = config.get('allowlist', DEFAULT_ALLOWLIST)
-    
-    for pattern in allowlist:
-        if re.match(pattern, text.strip()):
+    stripped = text.strip()
+    length = len(stripped)
+    for pattern, min_len, max_len in _compile_allowlist(config):
+        # Skip the regex engine when the length alone rules the pattern out
+        if min_len <= length <= max_len and pattern.match(stripped):
             return True
     
     return False
@@ -237,13 +432,8 @@ def redact_api_keys(text: str, config: Optional[Dict] = None) -> str:
     if config is None:
         config = load_redaction_config()
     
-    patterns = config.get('patterns', DEFAULT_PATTERNS)
-    api_key_patterns = [p for p in patterns if 'key' in p['name'].lower()]
-    
-    for pattern_def in api_key_patterns:
-        pattern = pattern_def['regex']
-        replacement = pattern_def.get('format', '***REDACTED***')
-        text = re.sub(pattern, replacement, text)
+    for compiled_pattern, replacement in _pattern_bucket(config, 'key'):
+        text = compiled_pattern.sub(replacement, text)
     
     return text
 
@@ -253,13 +443,8 @@ def redact_tokens(text: str, config: Optional[Dict] = None) -> str:
     if config is None:
         config = load_redaction_config()
     
-    patterns = config.get('patterns', DEFAULT_PATTERNS)
-    token_patterns = [p for p in patterns if 'token' in p['name'].lower()]
-    
-    for pattern_def in token_patterns:
-        pattern = pattern_def['regex']
-        replacement = pattern_def.get('format', '***REDACTED***')
-        text = re.sub(pattern, replacement, text)
+    for compiled_pattern, replacement in _pattern_bucket(config, 'token'):
+        text = compiled_pattern.sub(replacement, text)
     
     return text
 
@@ -269,13 +454,8 @@ def redact_env_vars(text: str, config: Optional[Dict] = None) -> str:
     if config is None:
         config = load_redaction_config()
     
-    patterns = config.get('patterns', DEFAULT_PATTERNS)
-    env_patterns = [p for p in patterns if 'env_var' in p['name'].lower()]
-    
-    for pattern_def in env_patterns:
-        pattern = pattern_def['regex']
-        replacement = pattern_def.get('format', '***REDACTED***')
-        text = re.sub(pattern, replacement, text)
+    for compiled_pattern, replacement in _pattern_bucket(config, 'env_var'):
+        text = compiled_pattern.sub(replacement, text)
     
     return text
 
@@ -285,23 +465,51 @@ def redact_base64_credentials(text: str, config: Optional[Dict] = None) -> str:
     if config is None:
         config = load_redaction_config()
     
-    patterns = config.get('patterns', DEFAULT_PATTERNS)
-    auth_patterns = [p for p in patterns if 'auth' in p['name'].lower() or 'bearer' in p['name'].lower()]
-    
-    for pattern_def in auth_patterns:
-        pattern = pattern_def['regex']
-        replacement = pattern_def.get('format', '***REDACTED***')
-        text = re.sub(pattern, replacement, text)
+    for compiled_pattern, replacement in _pattern_bucket(config, 'auth'):
+        text = compiled_pattern.sub(replacement, text)
     
     return text
 
 
+def _ensure_compiled(config: Dict) -> None:
+    """Build the compiled and fused pattern caches if not cached."""
+    global _compiled_patterns, _fused_pattern
+    
+    if _compiled_patterns is None:
+        _fused_pattern = _fuse_patterns(config)
+        _compiled_patterns = _compile_patterns(config)
+
+
+def _redactor(replacement: str, config: Dict) -> Callable[[Match], str]:
+    """
+    Build the re.sub callback for one pattern.
+    
+    Args:
+        replacement: The pattern's replacement format
+        config: Config dict used for allowlist checks
+    
+    Returns:
+        Callback returning allowlisted matches unchanged and the expanded
+        replacement otherwise
+    """
+    def _redact(match):
+        matched_text = match.group(0)
+        if is_allowlisted(matched_text, config):
+            return matched_text
+        return match.expand(replacement)
+    
+    return _redact
+
+
 def redact_text(text: Optional[str], config: Optional[Dict] = None) -> Optional[str]:
     """
     Main redaction function. Applies all redaction patterns to input text.
     Uses pre-compiled regex patterns for performance.
     Respects allowlist to prevent redacting legitimate patterns (Git SHAs, UUIDs, etc.)
     
+    Patterns are applied one after another in list order, so an earlier
+    pattern always takes priority over a later one that overlaps it.
+    
     Args:
         text: Text to redact
         config: Optional config dict. Will load from default location if not provided.
@@ -309,8 +517,6 @@ def redact_text(text: Optional[str], config: Optional[Dict] = None) -> Optional[
     Returns:
         Redacted text, or None/empty string if input was None/empty
     """
-    global _compiled_patterns
-    
     if text is None:
         return None
     
@@ -320,44 +526,117 @@ def redact_text(text: Optional[str], config: Optional[Dict] = None) -> Optional[
     if config is None:
         config = load_redaction_config()
     
-    # Compile patterns if not cached
-    if _compiled_patterns is None:
-        _compiled_patterns = _compile_patterns(config)
+    _ensure_compiled(config)
+    
+    # One scan settles the common case of text with nothing to redact
+    if _fused_pattern is not None and not _fused_pattern.search(text):
+        return text
     
-    # Apply all compiled patterns with allowlist checking
+    # Apply each compiled pattern in turn with allowlist checking
     for compiled_pattern, replacement in _compiled_patterns:
-        # Find all matches first
-        matches = list(compiled_pattern.finditer(text))
-        
-        # Process matches in reverse order to preserve string indices
-        for match in reversed(matches):
-            matched_text = match.group(0)
-            
-            # Check allowlist before redacting
-            if not is_allowlisted(matched_text, config):
-                # Replace this specific match
-                text = text[:match.start()] + replacement + text[match.end():]
+        text = compiled_pattern.sub(_redactor(replacement, config), text)
     
     return text
 
 
+def _redact_stream(chunks: Iterable[str], pattern: Pattern, redact: Callable[[Match], str]) -> Iterator[str]:
+    """
+    Apply pattern.sub(redact, ...) to a stream of text chunks.
+    
+    Only text before `limit` (REDACT_OVERLAP short of the buffered end) is
+    emitted per pass, and never past the start of a match that runs beyond
+    it. The concatenated output is therefore identical to a whole-text
+    pattern.sub() as long as no match, or failed match attempt, spans more
+    than REDACT_OVERLAP characters and no lookbehind needs more than
+    _REDACT_LOOKBEHIND.
+    
+    Args:
+        chunks: Text chunks in order
+        pattern: One compiled redaction pattern
+        redact: Replacement callback from _redactor
+    
+    Yields:
+        Redacted text, in order
+    """
+    chunks = iter(chunks)
+    buf = ""
+    start = 0  # buf[:start] is already emitted, kept only as lookbehind context
+    while True:
+        chunk = next(chunks, "")
+        eof = not chunk
+        buf += chunk
+        limit = len(buf) if eof else len(buf) - REDACT_OVERLAP
+        if limit <= start and not eof:
+            continue
+        
+        parts = []
+        pos = start
+        safe = limit
+        for match in pattern.finditer(buf, start):
+            if match.end() > limit:
+                # May still grow with the next chunk; rescan it whole then.
+                # Clamp to limit: a match starting in the overlap window must
+                # not commit the text before it, where a longer match could
+                # still start once more input arrives
+                safe = min(match.start(), limit)
+                break
+            parts.append(buf[pos:match.start()])
+            parts.append(redact(match))
+            pos = match.end()
+        parts.append(buf[pos:safe])
+        out = "".join(parts)
+        if out:
+            yield out
+        
+        if eof:
+            return
+        keep = max(safe - _REDACT_LOOKBEHIND, 0)
+        buf = buf[keep:]
+        start = safe - keep
+
+
 def redact_file(input_path: str, output_path: Optional[str] = None, config: Optional[Dict] = None) -> None:
     """
     Redact secrets from a file.
     
+    The file is streamed in REDACT_CHUNK_SIZE chunks so peak memory stays
+    bounded for large logs. When overwriting the input, output goes to a
+    temp file in the same directory that then replaces the original.
+    
     Args:
         input_path: Path to input file
         output_path: Path to output file. If None, overwrites input file.
         config: Optional config dict.
     """
-    with open(input_path, 'r') as f:
-        content = f.read()
-    
-    redacted = redact_text(content, config)
+    if config is None:
+        config = load_redaction_config()
     
+    _ensure_compiled(config)
     output = output_path or input_path
-    with open(output, 'w') as f:
-        f.write(redacted)
+    
+    def _write_redacted(src, dst):
+        # One streaming stage per pattern, chained in list order, so each
+        # pattern sees the previous one's output exactly as in redact_text
+        chunks = iter(lambda: src.read(REDACT_CHUNK_SIZE), "")
+        for compiled_pattern, replacement in _compiled_patterns:
+            chunks = _redact_stream(chunks, compiled_pattern, _redactor(replacement, config))
+        for piece in chunks:
+            dst.write(piece)
+    
+    if not os.path.exists(output) or not os.path.samefile(input_path, output):
+        with open(input_path, 'r') as src, open(output, 'w') as dst:
+            _write_redacted(src, dst)
+        return
+    
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output)), prefix='.redact-')
+    try:
+        with open(input_path, 'r') as src, os.fdopen(fd, 'w') as dst:
+            _write_redacted(src, dst)
+        shutil.copymode(input_path, tmp_path)
+        os.replace(tmp_path, output)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
 
 def redact_discord_message(message: str, config: Optional[Dict] = None) -> str:
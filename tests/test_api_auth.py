@@ -2,107 +2,143 @@
 import pytest
 import hmac
 import hashlib
+import importlib.util
 import time
-import json
-import os
-
-# Load the api-server module by executing it
-def load_api_server():
-    with open('scripts/api-server.py', 'r') as f:
-        code = f.read()
-    # Extract just the functions we need
-    globals_dict = {'__name__': '__test__'}
-    exec(code, globals_dict)
-    return globals_dict
-
-def test_unsigned_request_rejected():
+from pathlib import Path
+
+API_SERVER = Path(__file__).parent.parent / "scripts" / "api-server.py"
+
+# Request parts shared by the signing tests, as the bytes that get signed
+_SECRET = b'test-secret-123'
+_POST = b'POST'
+_UPLOAD = b'/config/upload'
+_BODY = b'{"habitat": {}}'
+
+# HMAC keyed with the test secret; sign() copies it instead of re-keying
+_HMAC_TEMPLATE = hmac.new(_SECRET, digestmod=hashlib.sha256)
+
+def sign(message):
+    """Hex HMAC-SHA256 of message (bytes) under the test secret."""
+    h = _HMAC_TEMPLATE.copy()
+    h.update(message)
+    return h.hexdigest()
+
+@pytest.fixture(scope="module")
+def api_module():
+    """Load api-server.py once for the module and return its namespace."""
+    spec = importlib.util.spec_from_file_location("api_server", API_SERVER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.__dict__
+
+@pytest.fixture
+def api(api_module, monkeypatch):
+    """Shared api-server namespace with API_SECRET set for this test only.
+
+    API_SECRET is read from the environment when the script is executed, so
+    tests patch the module global rather than os.environ.
+    """
+    monkeypatch.setitem(api_module, 'API_SECRET', 'test-secret-123')
+    return api_module
+
+def test_unsigned_request_rejected(api):
     """Requests without X-Signature header are rejected with 403."""
-    os.environ['API_SECRET'] = 'test-secret-123'
-    api = load_api_server()
-    
     timestamp = str(int(time.time()))
-    body = b'{"habitat": {}}'
+    body = _BODY
     
     result = api['verify_hmac_auth'](timestamp, None, 'POST', '/config/upload', body)
     assert result[0] is False, "Unsigned request should be rejected"
 
-def test_bad_signature_rejected():
+def test_bad_signature_rejected(api):
     """Requests with invalid signature are rejected with 403."""
-    os.environ['API_SECRET'] = 'test-secret-123'
-    api = load_api_server()
-    
     timestamp = str(int(time.time()))
-    body = b'{"habitat": {}}'
+    body = _BODY
     bad_signature = "invalid-signature"
     
     result = api['verify_hmac_auth'](timestamp, bad_signature, 'POST', '/config/upload', body)
     assert result[0] is False, "Bad signature should be rejected"
 
-def test_stale_timestamp_rejected():
+def test_stale_timestamp_rejected(api):
     """Requests with timestamp >300s old are rejected with 403."""
-    os.environ['API_SECRET'] = 'test-secret-123'
-    api = load_api_server()
-    
     # Create stale timestamp (400s ago)
     stale_timestamp = str(int(time.time()) - 400)
-    body = b'{"habitat": {}}'
+    body = _BODY
     
     # Generate valid signature for stale timestamp
-    message = f"{stale_timestamp}.POST./config/upload.{body.decode('utf-8')}"
-    signature = hmac.new(
-        'test-secret-123'.encode(),
-        message.encode(),
-        hashlib.sha256
-    ).hexdigest()
+    message = b'.'.join((stale_timestamp.encode(), _POST, _UPLOAD, body))
+    signature = sign(message)
     
     result = api['verify_hmac_auth'](stale_timestamp, signature, 'POST', '/config/upload', body)
     assert result[0] is False, "Stale timestamp should be rejected"
 
-def test_valid_signature_accepted():
+def test_valid_signature_accepted(api):
     """Requests with valid signature and fresh timestamp are accepted with 200."""
-    os.environ['API_SECRET'] = 'test-secret-123'
-    api = load_api_server()
-    
     timestamp = str(int(time.time()))
-    body = b'{"habitat": {}}'
+    body = _BODY
     
     # Generate valid signature
-    message = f"{timestamp}.POST./config/upload.{body.decode('utf-8')}"
-    signature = hmac.new(
-        'test-secret-123'.encode(),
-        message.encode(),
-        hashlib.sha256
-    ).hexdigest()
+    message = b'.'.join((timestamp.encode(), _POST, _UPLOAD, body))
+    signature = sign(message)
     
     result = api['verify_hmac_auth'](timestamp, signature, 'POST', '/config/upload', body)
     assert result[0] is True, "Valid signature should be accepted"
 
 
-def test_signature_binds_method_and_path():
+def test_signature_binds_method_and_path(api):
     """A valid signature for one endpoint/method must not work for another."""
-    os.environ['API_SECRET'] = 'test-secret-123'
-    api = load_api_server()
-
     timestamp = str(int(time.time()))
     body = b'{"agents": {"a": 1}}'
 
     # Sign for /config/upload
-    msg = f"{timestamp}.POST./config/upload.{body.decode('utf-8')}"
-    sig = hmac.new('test-secret-123'.encode(), msg.encode(), hashlib.sha256).hexdigest()
+    msg = b'.'.join((timestamp.encode(), _POST, _UPLOAD, body))
+    sig = sign(msg)
 
     assert api['verify_hmac_auth'](timestamp, sig, 'POST', '/config/upload', body)[0] is True
     # Same signature must fail for different method/path
     assert api['verify_hmac_auth'](timestamp, sig, 'POST', '/config/apply', body)[0] is False
     assert api['verify_hmac_auth'](timestamp, sig, 'GET', '/config/upload', body)[0] is False
 
-def test_missing_api_secret():
+def test_missing_api_secret(api, monkeypatch):
     """Server rejects all auth when API_SECRET is not set."""
-    if 'API_SECRET' in os.environ:
-        del os.environ['API_SECRET']
-    api = load_api_server()
+    monkeypatch.setitem(api, 'API_SECRET', '')
     
     timestamp = str(int(time.time()))
-    body = b'{"habitat": {}}'
+    body = _BODY
     
     result = api['verify_hmac_auth'](timestamp, "any-signature", 'POST', '/config/upload', body)
     assert result[0] is False, "Should reject when API_SECRET is missing"
+
+def test_changed_api_secret_takes_effect(api, monkeypatch):
+    """Signatures follow API_SECRET even after the cached HMAC key was built."""
+    timestamp = str(int(time.time()))
+    body = _BODY
+    msg = b'.'.join((timestamp.encode(), _POST, _UPLOAD, body))
+
+    assert api['verify_hmac_auth'](timestamp, sign(msg), 'POST', '/config/upload', body)[0] is True
+
+    monkeypatch.setitem(api, 'API_SECRET', 'rotated-secret')
+    rotated = hmac.new(b'rotated-secret', msg, hashlib.sha256).hexdigest()
+    assert api['verify_hmac_auth'](timestamp, sign(msg), 'POST', '/config/upload', body)[0] is False
+    assert api['verify_hmac_auth'](timestamp, rotated, 'POST', '/config/upload', body)[0] is True
+
+def test_stale_or_malformed_rejected_before_hashing(api, monkeypatch):
+    """Cheap checks (timestamp, signature format) fail fast without computing the HMAC."""
+    def _no_hmac(msg):
+        raise AssertionError("HMAC computed for a request that should fail fast")
+    monkeypatch.setitem(api, '_hmac_sha256', _no_hmac)
+    body = _BODY
+
+    ok, err = api['verify_hmac_auth'](str(int(time.time()) - 400), 'a' * 64, 'POST', '/config/upload', body)
+    assert ok is False and "expired" in err
+
+    ok, err = api['verify_hmac_auth'](str(int(time.time())), 'not-hex', 'POST', '/config/upload', body)
+    assert ok is False and "mismatch" in err
+
+def test_plain_keyed_sha256_rejected(api):
+    """Only HMAC-SHA256 is accepted; sha256(secret + message) is not a valid signature."""
+    timestamp = str(int(time.time()))
+    msg = b'.'.join((timestamp.encode(), _POST, _UPLOAD, _BODY))
+    keyed_sha = hashlib.sha256(_SECRET + msg).hexdigest()
+
+    result = api['verify_hmac_auth'](timestamp, keyed_sha, 'POST', '/config/upload', _BODY)
+    assert result[0] is False, "Plain keyed SHA-256 must not pass as an HMAC"
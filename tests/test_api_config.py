@@ -239,7 +239,7 @@ class TestGetConfig(unittest.TestCase):
         )
         
         self.assertTrue(result["habitat_exists"])
-        self.assertIn("habitat_modified", result)
+        self.assertEqual(result["habitat_modified_ns"], os.stat(habitat_path).st_mtime_ns)
 
     def test_does_not_expose_tokens(self):
         """Config status does not expose sensitive data."""
@@ -255,10 +255,13 @@ class TestGetConfig(unittest.TestCase):
             agents_path=os.path.join(self.temp_dir, "agents.json")
         )
         
-        # Should not contain any token values
-        result_str = json.dumps(result)
-        self.assertNotIn("SECRET123", result_str)
-        self.assertNotIn("Token", result_str)
+        # Only file metadata keys, and only bool/mtime values, so no
+        # habitat content (tokens included) can appear in the result
+        allowed = {"habitat_exists", "habitat_modified_ns", "agents_exists",
+                   "agents_modified_ns", "api_uploaded", "api_uploaded_at"}
+        self.assertEqual(set(result) - allowed, set())
+        for value in result.values():
+            self.assertIsInstance(value, (bool, int, float))
 
 
 class TestApplyConfigScript(unittest.TestCase):
@@ -269,19 +272,13 @@ class TestApplyConfigScript(unittest.TestCase):
         import base64
         content = {"name": "Test", "agents": []}
         
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-            json.dump(content, f)
-            temp_path = f.name
+        # Same bytes json.dump would write to the file, encoded in memory
+        payload = json.dumps(content).encode()
+        encoded = base64.b64encode(payload).decode()
         
-        try:
-            with open(temp_path, 'rb') as f:
-                encoded = base64.b64encode(f.read()).decode()
-            
-            # Decode and verify
-            decoded = json.loads(base64.b64decode(encoded))
-            self.assertEqual(decoded["name"], "Test")
-        finally:
-            os.unlink(temp_path)
+        # Decode and verify
+        decoded = json.loads(base64.b64decode(encoded))
+        self.assertEqual(decoded["name"], "Test")
 
 
 class TestApiUploadedMarker(unittest.TestCase):
@@ -432,11 +429,11 @@ def get_config_status(habitat_path, agents_path, marker_path=None):
     
     if result["habitat_exists"]:
         stat = os.stat(habitat_path)
-        result["habitat_modified"] = stat.st_mtime
+        result["habitat_modified_ns"] = stat.st_mtime_ns
     
     if result["agents_exists"]:
         stat = os.stat(agents_path)
-        result["agents_modified"] = stat.st_mtime
+        result["agents_modified_ns"] = stat.st_mtime_ns
     
     # Check for API upload marker (issue #115)
     if marker_path:
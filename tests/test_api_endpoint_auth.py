@@ -11,83 +11,152 @@ import time
 import json
 import hmac
 import hashlib
+import functools
 import unittest
+import http.client
 import http.server
+import socket
 import socketserver
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import requests
+from unittest.mock import patch
 
 
+API_SECRET = 'test-secret-key-endpoint-auth'
+# Port of the test server; setUpModule binds port 0 and stores the one the
+# OS picked, so parallel workers (pytest-xdist) never collide on it
+PORT = None
+
+# PARALLEL=1 runs only the concurrent endpoint matrix, skipping the
+# one-request-per-test classes that cover the same cases
+PARALLEL = os.environ.get('PARALLEL') == '1'
+
+# Sent with every request; http.client does not modify the dict it is given
+BASE_HEADERS = {'Content-Type': 'application/json'}
+
+# HMAC keyed with the test secret; compute_hmac_signature() copies it
+# instead of re-keying for every request
+_HMAC_TEMPLATE = hmac.new(API_SECRET.encode(), digestmod=hashlib.sha256)
+
+# Set by setUpModule: one loaded module and server for every test class
+api_module = None
+server = None
+
+
+@functools.lru_cache(maxsize=None)
 def load_api_server_module(api_secret):
-    """Load api-server.py as a module for testing.
+    """Load api-server.py as a module for testing (cached per secret).
     
     Args:
         api_secret: API secret to set before loading module
     """
     import importlib.util
     
-    # Set API_SECRET BEFORE loading module
-    os.environ['API_SECRET'] = api_secret
-    
     repo_root = Path(__file__).parent.parent
     api_server_path = repo_root / "scripts" / "api-server.py"
     
     spec = importlib.util.spec_from_file_location("api_server", api_server_path)
     module = importlib.util.module_from_spec(spec)
     
-    # Execute module to populate functions
-    spec.loader.exec_module(module)
+    # API_SECRET is read at module load; set it only while executing so it
+    # does not leak into os.environ for later tests
+    with patch.dict(os.environ, {'API_SECRET': api_secret}):
+        spec.loader.exec_module(module)
     
     return module
 
 
-def compute_hmac_signature(secret, timestamp, method, path, body):
-    """Compute HMAC-SHA256 signature for a request."""
-    if isinstance(body, bytes):
-        body = body.decode('utf-8')
-    elif body is None:
-        body = ''
+def compute_hmac_signature(template, timestamp, method, path, body_bytes):
+    """Compute HMAC-SHA256 signature for a request.
     
-    message = f"{timestamp}.{method}.{path}.{body}"
-    return hmac.new(secret.encode(), message.encode(), hashlib.sha256).hexdigest()
+    Args:
+        template: keyed hmac object to copy (e.g. _HMAC_TEMPLATE)
+        body_bytes: raw request body, signed as-is
+    """
+    message = b'.'.join((str(timestamp).encode(), method.encode(), path.encode(), body_bytes))
+    h = template.copy()
+    h.update(message)
+    return h.hexdigest()
+
 
+def wait_for_server(attempts=5):
+    """Confirm the test server accepts connections.
 
-class TestEndpointAuth(unittest.TestCase):
-    """Test that HTTP endpoints actually enforce HMAC authentication."""
+    server_activate() has already called listen(), so the first connect
+    succeeds in practice; the retries only cover a slow loopback.
+    """
+    for _ in range(attempts):
+        try:
+            socket.create_connection(('127.0.0.1', PORT), timeout=0.05).close()
+            return
+        except OSError:
+            time.sleep(0.005)
+    raise RuntimeError(f"test API server on port {PORT} did not accept connections")
+
+
+class Response:
+    """The parts of an HTTP response the tests read (requests.Response-like)."""
     
-    @classmethod
-    def setUpClass(cls):
-        """Start test API server."""
-        # Set test API secret BEFORE loading module
-        cls.api_secret = 'test-secret-key-endpoint-auth'
-        cls.api_module = load_api_server_module(cls.api_secret)
-        
-        # Start server in background thread
-        cls.port = 18080  # Use different port to avoid conflicts
-        cls.server = socketserver.TCPServer(
-            ('127.0.0.1', cls.port),
-            cls.api_module.H,
-            bind_and_activate=False
-        )
-        cls.server.allow_reuse_address = True
-        cls.server.server_bind()
-        cls.server.server_activate()
-        
-        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
-        cls.server_thread.start()
-        
-        # Base URL for requests
-        cls.base_url = f'http://127.0.0.1:{cls.port}'
-        
-        # Wait for server to be ready
-        time.sleep(0.5)
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
     
-    @classmethod
-    def tearDownClass(cls):
-        """Stop test API server."""
-        cls.server.shutdown()
-        cls.server.server_close()
+    def json(self):
+        return json.loads(self.content)
+
+
+def send_request(method, path, body, headers):
+    """Send one request to the test server and read the whole response.
+    
+    The handler speaks HTTP/1.0 and closes every connection after its
+    response, so each request opens its own; that also keeps concurrent
+    callers off a shared, non-thread-safe HTTPConnection.
+    """
+    conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=10)
+    try:
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        return Response(response.status, response.read())
+    finally:
+        conn.close()
+
+
+def setUpModule():
+    """Start the test API server once for all classes in this module."""
+    global api_module, server, PORT
+    api_module = load_api_server_module(API_SECRET)
+    
+    # Start server in background thread; each request gets its own daemon
+    # thread so one slow or held-open connection cannot block the others
+    server = socketserver.ThreadingTCPServer(
+        ('127.0.0.1', 0),
+        api_module.H,
+        bind_and_activate=False
+    )
+    server.daemon_threads = True
+    server.allow_reuse_address = True
+    server.server_bind()
+    server.server_activate()
+    PORT = server.server_address[1]
+    
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    
+    wait_for_server()
+
+
+def tearDownModule():
+    """Stop the test API server."""
+    server.shutdown()
+    server.server_close()
+
+
+class EndpointAuthMixin:
+    """Request helpers for the endpoint auth tests.
+    
+    A plain mixin rather than a TestCase, so test discovery does not collect
+    it as an empty class of its own.
+    """
     
     def make_authenticated_request(self, method, path, body=None):
         """Make an authenticated request to the API."""
@@ -100,43 +169,32 @@ class TestEndpointAuth(unittest.TestCase):
         body_bytes = body.encode('utf-8') if body else b''
         
         signature = compute_hmac_signature(
-            self.api_secret,
+            _HMAC_TEMPLATE,
             timestamp,
             method,
             path,
             body_bytes
         )
         
-        headers = {
-            'X-Timestamp': str(timestamp),
-            'X-Signature': signature,
-            'Content-Type': 'application/json'
-        }
+        headers = {**BASE_HEADERS, 'X-Timestamp': str(timestamp), 'X-Signature': signature}
         
         if method == 'GET':
-            return requests.get(f'{self.base_url}{path}', headers=headers)
+            return send_request('GET', path, None, headers)
         elif method == 'POST':
-            return requests.post(
-                f'{self.base_url}{path}',
-                data=body_bytes,
-                headers=headers
-            )
+            return send_request('POST', path, body_bytes, headers)
     
     def make_unauthenticated_request(self, method, path, body=None):
         """Make an unauthenticated request to the API."""
-        headers = {'Content-Type': 'application/json'}
+        headers = BASE_HEADERS
         
         if method == 'GET':
-            return requests.get(f'{self.base_url}{path}', headers=headers)
+            return send_request('GET', path, None, headers)
         elif method == 'POST':
-            return requests.post(
-                f'{self.base_url}{path}',
-                data=body.encode('utf-8') if body else b'{}',
-                headers=headers
-            )
+            return send_request('POST', path, body.encode('utf-8') if body else b'{}', headers)
 
 
-class TestUnprotectedEndpoints(TestEndpointAuth):
+@unittest.skipIf(PARALLEL, "covered by TestEndpointMatrix when PARALLEL=1")
+class TestUnprotectedEndpoints(EndpointAuthMixin, unittest.TestCase):
     """Test that unprotected endpoints work without HMAC authentication."""
     
     def test_status_endpoint_works_without_auth(self):
@@ -175,7 +233,8 @@ class TestUnprotectedEndpoints(TestEndpointAuth):
                      "/config/status should return api_uploaded field")
 
 
-class TestProtectedEndpoints(TestEndpointAuth):
+@unittest.skipIf(PARALLEL, "covered by TestEndpointMatrix when PARALLEL=1")
+class TestProtectedEndpoints(EndpointAuthMixin, unittest.TestCase):
     """Test that protected endpoints reject requests without valid HMAC."""
     
     def test_sync_rejects_unauthenticated_request(self):
@@ -315,5 +374,43 @@ class TestProtectedEndpoints(TestEndpointAuth):
                         "/log should return 200 with valid authentication")
 
 
+# (path, authenticated, accepted status codes); mirrors the per-endpoint
+# tests above. Only read-only GETs are listed: the state-changing POSTs are
+# already covered once each above, and replaying them concurrently here would
+# repeat their side effects and race them against each other.
+ENDPOINT_MATRIX = [
+    ('/status', False, {200}),
+    ('/health', False, {200, 503}),
+    ('/config/status', False, {200}),
+    ('/config', False, {403}),
+    ('/config', True, {200}),
+    ('/stages', False, {403}),
+    ('/stages', True, {200}),
+    ('/log', False, {403}),
+    ('/log', True, {200}),
+]
+
+
+class TestEndpointMatrix(EndpointAuthMixin, unittest.TestCase):
+    """Check every GET auth case in ENDPOINT_MATRIX with concurrent requests."""
+    
+    def request_case(self, case):
+        """Send the GET described by one ENDPOINT_MATRIX row."""
+        path, authenticated, _ = case
+        if authenticated:
+            return self.make_authenticated_request('GET', path)
+        return self.make_unauthenticated_request('GET', path)
+    
+    def test_all_endpoints_matrix(self):
+        """TASK-170: protected endpoints need HMAC, unprotected ones do not."""
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            responses = list(pool.map(self.request_case, ENDPOINT_MATRIX))
+        
+        for (path, authenticated, expected), response in zip(ENDPOINT_MATRIX, responses):
+            with self.subTest(path=path, authenticated=authenticated):
+                self.assertIn(response.status_code, expected,
+                             f"GET {path} (authenticated={authenticated})")
+
+
 if __name__ == '__main__':
     unittest.main()
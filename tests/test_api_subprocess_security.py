@@ -4,100 +4,117 @@
 Verifies that subprocess calls do NOT use shell=True to prevent shell injection
 vulnerabilities.
 """
+import ast
 import os
 import sys
-import re
 import unittest
+from collections import namedtuple
 from pathlib import Path
 
 
+# Read once at import; both classes inspect the same source
+API_SERVER_SOURCE = (Path(__file__).parent.parent / "scripts" / "api-server.py").read_text()
+
+_SUBPROCESS_FUNCS = {'run', 'Popen', 'call', 'check_call', 'check_output'}
+
+# One subprocess.<func>(...) call site. keywords maps each keyword to its
+# literal value (or the AST node when it is not a literal); argv is the list
+# of string literals when the first argument is a list display, else None.
+SubprocessCall = namedtuple('SubprocessCall', 'lineno func keywords argv')
+
+
+class _ApiServerIndex(ast.NodeVisitor):
+    """Collect subprocess calls and the `if self.path == '...'` endpoint branches."""
+
+    def __init__(self):
+        self.calls = []
+        self.endpoint_calls = {}
+        self._endpoint = None
+
+    def visit_If(self, node):
+        path = _endpoint_path(node.test)
+        if path is None:
+            self.generic_visit(node)
+            return
+        # Only the branch body belongs to the endpoint; the elif chain
+        # continues in orelse
+        self.endpoint_calls.setdefault(path, [])
+        outer, self._endpoint = self._endpoint, path
+        for stmt in node.body:
+            self.visit(stmt)
+        self._endpoint = outer
+        for stmt in node.orelse:
+            self.visit(stmt)
+
+    def visit_Call(self, node):
+        func = node.func
+        if (isinstance(func, ast.Attribute) and func.attr in _SUBPROCESS_FUNCS
+                and isinstance(func.value, ast.Name) and func.value.id == 'subprocess'):
+            keywords = {kw.arg: kw.value.value if isinstance(kw.value, ast.Constant) else kw.value
+                        for kw in node.keywords}
+            argv = None
+            if node.args and isinstance(node.args[0], ast.List):
+                argv = [elt.value for elt in node.args[0].elts
+                        if isinstance(elt, ast.Constant) and isinstance(elt.value, str)]
+            call = SubprocessCall(node.lineno, func.attr, keywords, argv)
+            self.calls.append(call)
+            if self._endpoint is not None:
+                self.endpoint_calls[self._endpoint].append(call)
+        self.generic_visit(node)
+
+
+def _endpoint_path(test):
+    """Return '/x' for a `self.path == '/x'` test, else None."""
+    if (isinstance(test, ast.Compare) and len(test.ops) == 1 and isinstance(test.ops[0], ast.Eq)
+            and isinstance(test.left, ast.Attribute) and test.left.attr == 'path'
+            and isinstance(test.left.value, ast.Name) and test.left.value.id == 'self'
+            and isinstance(test.comparators[0], ast.Constant)):
+        return test.comparators[0].value
+    return None
+
+
+# Parse once; every test queries this index instead of rescanning the source
+_INDEX = _ApiServerIndex()
+_INDEX.visit(ast.parse(API_SERVER_SOURCE))
+SUBPROCESS_CALLS = _INDEX.calls
+ENDPOINT_SUBPROCESS_CALLS = _INDEX.endpoint_calls
+
+
 class TestSubprocessSecurity(unittest.TestCase):
     """Test that subprocess calls in api-server.py do NOT use shell=True."""
     
-    @classmethod
-    def setUpClass(cls):
-        """Load api-server.py source code."""
-        repo_root = Path(__file__).parent.parent
-        api_server_path = repo_root / "scripts" / "api-server.py"
-        
-        with open(api_server_path, 'r') as f:
-            cls.source_code = f.read()
+    def assert_endpoint_uses_list_args(self, path):
+        """Endpoint `path` runs subprocesses only with list argv and no shell=True."""
+        self.assertIn(path, ENDPOINT_SUBPROCESS_CALLS, f"{path} endpoint should exist")
+        calls = ENDPOINT_SUBPROCESS_CALLS[path]
+        self.assertGreater(len(calls), 0, f"{path} should contain subprocess calls")
+        
+        for call in calls:
+            self.assertNotIn('shell', call.keywords,
+                             f"{path} endpoint must not pass shell= (line {call.lineno})")
+            self.assertIsNotNone(call.argv,
+                                 f"{path} should use list-based subprocess arguments (line {call.lineno})")
     
     def test_no_shell_true_in_subprocess_calls(self):
         """TASK-171 AC1: No subprocess calls should use shell=True."""
-        # Find all subprocess.run and subprocess.Popen calls with shell=True
-        pattern = r'subprocess\.(run|Popen|call|check_call|check_output)\([^)]*shell\s*=\s*True'
-        matches = re.findall(pattern, self.source_code)
+        matches = [call.lineno for call in SUBPROCESS_CALLS if call.keywords.get('shell') is True]
         
         self.assertEqual(len(matches), 0,
-                        f"Found {len(matches)} subprocess calls with shell=True. "
+                        f"Found {len(matches)} subprocess calls with shell=True (lines {matches}). "
                         f"All should use list-based arguments instead.")
     
     def test_sync_endpoint_uses_list_args(self):
         """TASK-171 AC2: /sync endpoint should use list-based subprocess args."""
-        # Find the /sync endpoint code
-        sync_pattern = r"self\.path\s*==\s*'/sync'(.*?)(?=elif|else:)"
-        match = re.search(sync_pattern, self.source_code, re.DOTALL)
-        
-        self.assertIsNotNone(match, "/sync endpoint should exist")
-        
-        sync_code = match.group(1)
-        
-        # Check for subprocess calls
-        subprocess_calls = re.findall(r'subprocess\.(run|Popen)', sync_code)
-        self.assertGreater(len(subprocess_calls), 0, 
-                          "/sync should contain subprocess calls")
-        
-        # Verify shell=True is not used
-        shell_true = re.search(r'shell\s*=\s*True', sync_code)
-        self.assertIsNone(shell_true, 
-                         "/sync endpoint must not use shell=True")
-        
-        # Verify list-based arguments are used (look for [ brackets)
-        list_args = re.search(r'subprocess\.\w+\(\s*\[', sync_code)
-        self.assertIsNotNone(list_args,
-                            "/sync should use list-based subprocess arguments")
+        self.assert_endpoint_uses_list_args('/sync')
     
     def test_prepare_shutdown_uses_list_args(self):
         """TASK-171 AC3: /prepare-shutdown endpoint should use list-based subprocess args."""
-        # Find the /prepare-shutdown endpoint code
-        shutdown_pattern = r"self\.path\s*==\s*'/prepare-shutdown'(.*?)(?=elif|else:)"
-        match = re.search(shutdown_pattern, self.source_code, re.DOTALL)
-        
-        self.assertIsNotNone(match, "/prepare-shutdown endpoint should exist")
-        
-        shutdown_code = match.group(1)
-        
-        # Check for subprocess calls
-        subprocess_calls = re.findall(r'subprocess\.(run|Popen)', shutdown_code)
-        self.assertGreater(len(subprocess_calls), 0,
-                          "/prepare-shutdown should contain subprocess calls")
-        
-        # Verify shell=True is not used
-        shell_true = re.search(r'shell\s*=\s*True', shutdown_code)
-        self.assertIsNone(shell_true,
-                         "/prepare-shutdown endpoint must not use shell=True")
-        
-        # Verify list-based arguments are used
-        list_args = re.search(r'subprocess\.\w+\(\s*\[', shutdown_code)
-        self.assertIsNotNone(list_args,
-                            "/prepare-shutdown should use list-based subprocess arguments")
+        self.assert_endpoint_uses_list_args('/prepare-shutdown')
     
     def test_all_subprocess_calls_examined(self):
         """TASK-171 AC4: Document all subprocess call locations for security audit."""
-        # Find all subprocess calls
-        subprocess_pattern = r'subprocess\.(run|Popen|call|check_call|check_output)\('
-        matches = list(re.finditer(subprocess_pattern, self.source_code))
-        
-        # Get line numbers
-        lines = self.source_code.split('\n')
-        call_locations = []
-        
-        for match in matches:
-            # Find line number
-            line_num = self.source_code[:match.start()].count('\n') + 1
-            line_content = lines[line_num - 1].strip()
-            call_locations.append((line_num, line_content))
+        lines = API_SERVER_SOURCE.split('\n')
+        call_locations = [(call.lineno, lines[call.lineno - 1].strip()) for call in SUBPROCESS_CALLS]
         
         # Expected locations (update after fixing):
         # - check_service function (line ~38) - already safe
@@ -117,55 +134,34 @@ class TestSubprocessSecurity(unittest.TestCase):
 class TestSubprocessFunctionality(unittest.TestCase):
     """Test that correct commands are called after removing shell=True."""
     
-    @classmethod
-    def setUpClass(cls):
-        """Load api-server.py source code."""
-        repo_root = Path(__file__).parent.parent
-        api_server_path = repo_root / "scripts" / "api-server.py"
-        
-        with open(api_server_path, 'r') as f:
-            cls.source_code = f.read()
+    def endpoint_argvs(self, path):
+        """List argvs of the subprocess calls in endpoint `path`."""
+        self.assertIn(path, ENDPOINT_SUBPROCESS_CALLS, f"{path} endpoint should exist")
+        return [call.argv or [] for call in ENDPOINT_SUBPROCESS_CALLS[path]]
     
     def test_sync_endpoint_calls_correct_script(self):
         """TASK-171 AC5: /sync endpoint calls sync-openclaw-state.sh script."""
-        # Find /sync endpoint
-        sync_pattern = r"self\.path\s*==\s*'/sync'(.*?)(?=elif|else:)"
-        match = re.search(sync_pattern, self.source_code, re.DOTALL)
-        
-        self.assertIsNotNone(match, "/sync endpoint should exist")
-        sync_code = match.group(1)
+        argvs = self.endpoint_argvs('/sync')
         
         # Verify sync-openclaw-state.sh is called
-        self.assertIn('sync-openclaw-state.sh', sync_code,
-                     "/sync should call sync-openclaw-state.sh")
+        self.assertTrue(any(argv and argv[0].endswith('sync-openclaw-state.sh') for argv in argvs),
+                        "/sync should call sync-openclaw-state.sh")
     
     def test_prepare_shutdown_calls_sync_script(self):
         """TASK-171 AC6: /prepare-shutdown calls sync-openclaw-state.sh script."""
-        shutdown_pattern = r"self\.path\s*==\s*'/prepare-shutdown'(.*?)(?=elif|else:)"
-        match = re.search(shutdown_pattern, self.source_code, re.DOTALL)
-        
-        self.assertIsNotNone(match, "/prepare-shutdown endpoint should exist")
-        shutdown_code = match.group(1)
+        argvs = self.endpoint_argvs('/prepare-shutdown')
         
         # Verify sync script is called
-        self.assertIn('sync-openclaw-state.sh', shutdown_code,
-                     "/prepare-shutdown should call sync-openclaw-state.sh")
+        self.assertTrue(any(argv and argv[0].endswith('sync-openclaw-state.sh') for argv in argvs),
+                        "/prepare-shutdown should call sync-openclaw-state.sh")
     
     def test_prepare_shutdown_stops_openclaw(self):
         """TASK-171 AC7: /prepare-shutdown calls systemctl stop openclaw."""
-        shutdown_pattern = r"self\.path\s*==\s*'/prepare-shutdown'(.*?)(?=elif|else:)"
-        match = re.search(shutdown_pattern, self.source_code, re.DOTALL)
-        
-        self.assertIsNotNone(match, "/prepare-shutdown endpoint should exist")
-        shutdown_code = match.group(1)
+        argvs = self.endpoint_argvs('/prepare-shutdown')
         
         # Verify systemctl stop is called
-        self.assertIn('systemctl', shutdown_code,
-                     "/prepare-shutdown should call systemctl")
-        self.assertIn('stop', shutdown_code,
-                     "/prepare-shutdown should stop service")
-        self.assertIn('openclaw', shutdown_code,
-                     "/prepare-shutdown should stop openclaw")
+        self.assertIn(['systemctl', 'stop', 'openclaw'], argvs,
+                     "/prepare-shutdown should stop openclaw with systemctl")
 
 
 if __name__ == '__main__':
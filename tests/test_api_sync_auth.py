@@ -3,24 +3,31 @@
 
 Verifies that critical mutation endpoints require HMAC authentication.
 """
+import ast
 import os
 import sys
 import time
 import json
 import hmac
 import hashlib
+import functools
 import unittest
 from pathlib import Path
+from unittest.mock import patch
 
 
+API_SERVER_PATH = Path(__file__).parent.parent / "scripts" / "api-server.py"
+
+# Read once at import for the source-level coverage tests
+API_SERVER_SOURCE = API_SERVER_PATH.read_text()
+
+
+@functools.lru_cache(maxsize=None)
 def load_api_server_module():
-    """Load api-server.py as a module for testing."""
+    """Load api-server.py as a module for testing (executed once, then cached)."""
     import importlib.util
     
-    repo_root = Path(__file__).parent.parent
-    api_server_path = repo_root / "scripts" / "api-server.py"
-    
-    spec = importlib.util.spec_from_file_location("api_server", api_server_path)
+    spec = importlib.util.spec_from_file_location("api_server", API_SERVER_PATH)
     module = importlib.util.module_from_spec(spec)
     
     # Execute module to populate functions
@@ -29,92 +36,162 @@ def load_api_server_module():
     return module
 
 
-def compute_hmac_signature(secret, timestamp, method, path, body):
-    """Compute HMAC-SHA256 signature for a request."""
-    if isinstance(body, bytes):
-        body = body.decode('utf-8')
-    elif body is None:
-        body = ''
+# Set by setUpModule: the loaded api-server module shared by every test class
+api_module = None
+
+
+def setUpModule():
+    """Load api-server.py once for all classes in this module."""
+    global api_module
+    api_module = load_api_server_module()
+
+
+def set_api_secret(test, secret):
+    """Set the loaded module's API_SECRET until test finishes, then restore it.
+    
+    api-server.py reads the environment only at load time; verify_hmac_auth
+    uses the module global, so that is what the tests patch.
+    """
+    patcher = patch.object(api_module, 'API_SECRET', secret)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+# Every signing test uses this secret; compute_hmac_signature() copies the
+# keyed template instead of re-keying an HMAC per call
+TEST_SECRET = 'test-secret-key'
+_HMAC_TEMPLATE = hmac.new(TEST_SECRET.encode(), digestmod=hashlib.sha256)
+
+# Request body sent by every test
+EMPTY_JSON = b'{}'
+
+# Well-formed (64 lowercase hex chars) but wrong: rejected by the HMAC
+# comparison itself, not by the signature format check in front of it
+WRONG_SIGNATURE = '0' * 64
+
+
+@functools.lru_cache(maxsize=128)
+def compute_hmac_signature(timestamp, method, path, body_bytes):
+    """Compute HMAC-SHA256 signature for a request under TEST_SECRET.
+    
+    Cached: the secret is fixed, so equal arguments always sign the same.
+    
+    Args:
+        timestamp: int Unix timestamp
+        body_bytes: raw request body (bytes), signed as-is
+    """
+    h = _HMAC_TEMPLATE.copy()
+    h.update(b"%d.%s.%s.%s" % (timestamp, method.encode(), path.encode(), body_bytes))
+    return h.hexdigest()
+
+
+class _PostEndpointCollector(ast.NodeVisitor):
+    """Collect the paths that do_POST compares self.path against."""
+    
+    def __init__(self):
+        self.paths = []
+        self._in_do_post = False
+    
+    def visit_FunctionDef(self, node):
+        outer = self._in_do_post
+        self._in_do_post = node.name == 'do_POST'
+        self.generic_visit(node)
+        self._in_do_post = outer
     
-    message = f"{timestamp}.{method}.{path}.{body}"
-    return hmac.new(secret.encode(), message.encode(), hashlib.sha256).hexdigest()
+    def visit_Compare(self, node):
+        left = node.left
+        if (self._in_do_post and isinstance(left, ast.Attribute) and left.attr == 'path'
+                and isinstance(left.value, ast.Name) and left.value.id == 'self'):
+            for comparator in node.comparators:
+                values = comparator.elts if isinstance(comparator, (ast.Tuple, ast.List, ast.Set)) else [comparator]
+                self.paths.extend(v.value for v in values
+                                  if isinstance(v, ast.Constant) and isinstance(v.value, str)
+                                  and v.value.startswith('/'))
+        self.generic_visit(node)
+
+
+def _find_post_branch(path):
+    """Return the do_POST `if self.path == path` node, or None."""
+    tree = ast.parse(API_SERVER_SOURCE, filename=str(API_SERVER_PATH))
+    for func in ast.walk(tree):
+        if not (isinstance(func, ast.FunctionDef) and func.name == 'do_POST'):
+            continue
+        for node in ast.walk(func):
+            if (isinstance(node, ast.If) and isinstance(node.test, ast.Compare)
+                    and isinstance(node.test.left, ast.Attribute) and node.test.left.attr == 'path'
+                    and any(isinstance(c, ast.Constant) and c.value == path
+                            for c in node.test.comparators)):
+                # Only the branch body: the orelse chain holds the other endpoints
+                return ast.Module(body=node.body, type_ignores=[])
+    return None
 
 
 class TestSyncEndpointAuth(unittest.TestCase):
     """Test /sync endpoint requires HMAC authentication."""
     
-    @classmethod
-    def setUpClass(cls):
-        """Load api-server module once for all tests."""
-        cls.api_module = load_api_server_module()
+    def setUp(self):
+        # One "now" per test, so signing and verifying use the same second
+        self.now = int(time.time())
     
     def test_sync_rejects_unsigned_request(self):
         """SEC-001 AC1: /sync rejects requests without HMAC headers."""
         # Verify that verify_hmac_auth would reject missing headers
-        result = self.api_module.verify_hmac_auth(
+        result = api_module.verify_hmac_auth(
             timestamp_header=None,
             signature_header=None,
             method='POST',
             path='/sync',
-            body=b'{}'
+            body=EMPTY_JSON
         )
         self.assertFalse(result[0], "/sync should reject unsigned requests")
     
     def test_sync_rejects_bad_signature(self):
         """SEC-001 AC2: /sync rejects requests with invalid signature."""
-        os.environ['API_SECRET'] = 'test-secret-key'
+        set_api_secret(self, TEST_SECRET)
         
-        timestamp = int(time.time())
-        bad_signature = 'invalid_signature_12345'
+        timestamp = self.now
+        bad_signature = WRONG_SIGNATURE
         
-        result = self.api_module.verify_hmac_auth(
+        result = api_module.verify_hmac_auth(
             timestamp_header=str(timestamp),
             signature_header=bad_signature,
             method='POST',
             path='/sync',
-            body=b'{}'
+            body=EMPTY_JSON
         )
         self.assertFalse(result[0], "/sync should reject bad signatures")
+        self.assertIn("Signature mismatch (check API_SECRET", result[1])
     
     def test_sync_accepts_valid_signature(self):
         """SEC-001 AC3: /sync accepts requests with valid HMAC signature."""
-        secret = 'test-secret-key'
+        set_api_secret(self, TEST_SECRET)
         
-        # Set env var before loading module (or reload module)
-        # For this test, we'll use the module's API_SECRET directly
-        original_secret = self.api_module.API_SECRET
-        self.api_module.API_SECRET = secret
+        timestamp = self.now
+        body = EMPTY_JSON
+        signature = compute_hmac_signature(timestamp, 'POST', '/sync', body)
         
-        try:
-            timestamp = int(time.time())
-            body = b'{}'
-            signature = compute_hmac_signature(secret, timestamp, 'POST', '/sync', body)
-            
-            result = self.api_module.verify_hmac_auth(
-                timestamp_header=str(timestamp),
-                signature_header=signature,
-                method='POST',
-                path='/sync',
-                body=body
-            )
-            self.assertTrue(result[0], "/sync should accept valid signatures")
-        finally:
-            # Restore original
-            self.api_module.API_SECRET = original_secret
+        result = api_module.verify_hmac_auth(
+            timestamp_header=str(timestamp),
+            signature_header=signature,
+            method='POST',
+            path='/sync',
+            body=body
+        )
+        self.assertTrue(result[0], "/sync should accept valid signatures")
     
     def test_sync_signature_binds_to_endpoint(self):
         """SEC-001 AC4: /sync signature is endpoint-specific (prevents cross-endpoint replay)."""
-        secret = 'test-secret-key'
-        os.environ['API_SECRET'] = secret
+        secret = TEST_SECRET
+        set_api_secret(self, secret)
         
-        timestamp = int(time.time())
-        body = b'{}'
+        timestamp = self.now
+        body = EMPTY_JSON
         
         # Create valid signature for /config/upload
-        wrong_endpoint_sig = compute_hmac_signature(secret, timestamp, 'POST', '/config/upload', body)
+        wrong_endpoint_sig = compute_hmac_signature(timestamp, 'POST', '/config/upload', body)
         
         # Try to use it for /sync (should fail)
-        result = self.api_module.verify_hmac_auth(
+        result = api_module.verify_hmac_auth(
             timestamp_header=str(timestamp),
             signature_header=wrong_endpoint_sig,
             method='POST',
@@ -122,163 +199,73 @@ class TestSyncEndpointAuth(unittest.TestCase):
             body=body
         )
         self.assertFalse(result[0], "/sync should reject cross-endpoint replay attacks")
-    
-    def test_sync_rejects_stale_timestamp(self):
-        """TASK-173 AC1: /sync rejects requests with stale timestamps (>300s old)."""
-        secret = 'test-secret-key'
-        
-        # Set module's API_SECRET directly
-        original_secret = self.api_module.API_SECRET
-        self.api_module.API_SECRET = secret
-        
-        try:
-            # Create stale timestamp (400 seconds ago, beyond 300s window)
-            stale_timestamp = int(time.time()) - 400
-            body = b'{}'
-            
-            # Generate valid signature for the stale timestamp
-            signature = compute_hmac_signature(secret, stale_timestamp, 'POST', '/sync', body)
-            
-            # Should reject due to stale timestamp
-            result = self.api_module.verify_hmac_auth(
-                timestamp_header=str(stale_timestamp),
-                signature_header=signature,
-                method='POST',
-                path='/sync',
-                body=body
-            )
-            self.assertFalse(result[0], "/sync should reject requests with stale timestamps (>300s old)")
-        finally:
-            self.api_module.API_SECRET = original_secret
-    
-    def test_sync_accepts_timestamp_within_window(self):
-        """TASK-173 AC3: /sync accepts requests with timestamps within ±300s window."""
-        secret = 'test-secret-key'
-        
-        # Set module's API_SECRET directly
-        original_secret = self.api_module.API_SECRET
-        self.api_module.API_SECRET = secret
-        
-        try:
-            # Test timestamps at the edge of acceptable window
-            # 290 seconds ago (within 300s window)
-            recent_timestamp = int(time.time()) - 290
-            body = b'{}'
-            
-            signature = compute_hmac_signature(secret, recent_timestamp, 'POST', '/sync', body)
-            
-            result = self.api_module.verify_hmac_auth(
-                timestamp_header=str(recent_timestamp),
-                signature_header=signature,
-                method='POST',
-                path='/sync',
-                body=body
-            )
-            self.assertTrue(result[0], "/sync should accept timestamps within ±300s window")
-        finally:
-            self.api_module.API_SECRET = original_secret
-    
-    def test_sync_rejects_future_timestamp(self):
-        """TASK-173 AC4: /sync rejects requests with timestamps too far in future (>300s)."""
-        secret = 'test-secret-key'
-        
-        # Set module's API_SECRET directly
-        original_secret = self.api_module.API_SECRET
-        self.api_module.API_SECRET = secret
-        
-        try:
-            # Create future timestamp (400 seconds ahead, beyond 300s window)
-            future_timestamp = int(time.time()) + 400
-            body = b'{}'
-            
-            # Generate valid signature for the future timestamp
-            signature = compute_hmac_signature(secret, future_timestamp, 'POST', '/sync', body)
-            
-            # Should reject due to future timestamp
-            result = self.api_module.verify_hmac_auth(
-                timestamp_header=str(future_timestamp),
-                signature_header=signature,
-                method='POST',
-                path='/sync',
-                body=body
-            )
-            self.assertFalse(result[0], "/sync should reject requests with future timestamps (>300s ahead)")
-        finally:
-            self.api_module.API_SECRET = original_secret
 
 
 class TestPrepareShutdownAuth(unittest.TestCase):
     """Test /prepare-shutdown endpoint requires HMAC authentication."""
     
-    @classmethod
-    def setUpClass(cls):
-        """Load api-server module once for all tests."""
-        cls.api_module = load_api_server_module()
+    def setUp(self):
+        # One "now" per test, so signing and verifying use the same second
+        self.now = int(time.time())
     
     def test_prepare_shutdown_rejects_unsigned_request(self):
         """SEC-001 AC5: /prepare-shutdown rejects requests without HMAC headers."""
-        result = self.api_module.verify_hmac_auth(
+        result = api_module.verify_hmac_auth(
             timestamp_header=None,
             signature_header=None,
             method='POST',
             path='/prepare-shutdown',
-            body=b'{}'
+            body=EMPTY_JSON
         )
         self.assertFalse(result[0], "/prepare-shutdown should reject unsigned requests")
     
     def test_prepare_shutdown_rejects_bad_signature(self):
         """SEC-001 AC6: /prepare-shutdown rejects requests with invalid signature."""
-        os.environ['API_SECRET'] = 'test-secret-key'
+        set_api_secret(self, TEST_SECRET)
         
-        timestamp = int(time.time())
-        bad_signature = 'invalid_signature_12345'
+        timestamp = self.now
+        bad_signature = WRONG_SIGNATURE
         
-        result = self.api_module.verify_hmac_auth(
+        result = api_module.verify_hmac_auth(
             timestamp_header=str(timestamp),
             signature_header=bad_signature,
             method='POST',
             path='/prepare-shutdown',
-            body=b'{}'
+            body=EMPTY_JSON
         )
         self.assertFalse(result[0], "/prepare-shutdown should reject bad signatures")
+        self.assertIn("Signature mismatch (check API_SECRET", result[1])
     
     def test_prepare_shutdown_accepts_valid_signature(self):
         """SEC-001 AC7: /prepare-shutdown accepts requests with valid HMAC signature."""
-        secret = 'test-secret-key'
+        set_api_secret(self, TEST_SECRET)
         
-        # Set module's API_SECRET directly
-        original_secret = self.api_module.API_SECRET
-        self.api_module.API_SECRET = secret
+        timestamp = self.now
+        body = EMPTY_JSON
+        signature = compute_hmac_signature(timestamp, 'POST', '/prepare-shutdown', body)
         
-        try:
-            timestamp = int(time.time())
-            body = b'{}'
-            signature = compute_hmac_signature(secret, timestamp, 'POST', '/prepare-shutdown', body)
-            
-            result = self.api_module.verify_hmac_auth(
-                timestamp_header=str(timestamp),
-                signature_header=signature,
-                method='POST',
-                path='/prepare-shutdown',
-                body=body
-            )
-            self.assertTrue(result[0], "/prepare-shutdown should accept valid signatures")
-        finally:
-            self.api_module.API_SECRET = original_secret
+        result = api_module.verify_hmac_auth(
+            timestamp_header=str(timestamp),
+            signature_header=signature,
+            method='POST',
+            path='/prepare-shutdown',
+            body=body
+        )
+        self.assertTrue(result[0], "/prepare-shutdown should accept valid signatures")
     
     def test_prepare_shutdown_signature_binds_to_endpoint(self):
         """SEC-001 AC8: /prepare-shutdown signature is endpoint-specific."""
-        secret = 'test-secret-key'
-        os.environ['API_SECRET'] = secret
+        secret = TEST_SECRET
+        set_api_secret(self, secret)
         
-        timestamp = int(time.time())
-        body = b'{}'
+        timestamp = self.now
+        body = EMPTY_JSON
         
         # Create valid signature for /sync
-        wrong_endpoint_sig = compute_hmac_signature(secret, timestamp, 'POST', '/sync', body)
+        wrong_endpoint_sig = compute_hmac_signature(timestamp, 'POST', '/sync', body)
         
         # Try to use it for /prepare-shutdown (should fail)
-        result = self.api_module.verify_hmac_auth(
+        result = api_module.verify_hmac_auth(
             timestamp_header=str(timestamp),
             signature_header=wrong_endpoint_sig,
             method='POST',
@@ -290,140 +277,75 @@ class TestPrepareShutdownAuth(unittest.TestCase):
     def test_prepare_shutdown_prevents_dos(self):
         """SEC-001 AC9: /prepare-shutdown prevents DoS by requiring auth.
         
-        This test verifies that an attacker cannot DoS the system by stopping
-        openclaw service without authentication.
+        An attacker must not be able to stop the openclaw service without
+        authenticating. The rejection itself is covered by the bad-signature
+        test above; this checks the handler runs verify_hmac_auth before it
+        runs any command.
         """
-        # Without valid credentials, verify_hmac_auth returns False
-        result = self.api_module.verify_hmac_auth(
-            timestamp_header=str(int(time.time())),
-            signature_header='attacker_signature',
-            method='POST',
-            path='/prepare-shutdown',
-            body=b'{}'
-        )
-        self.assertFalse(result[0], "DoS attack should be prevented by authentication")
+        branch = _find_post_branch('/prepare-shutdown')
+        self.assertIsNotNone(branch, "do_POST should handle /prepare-shutdown")
+        
+        calls = [node for node in ast.walk(branch) if isinstance(node, ast.Call)]
+        auth_lines = [c.lineno for c in calls
+                      if isinstance(c.func, ast.Name) and c.func.id == 'verify_hmac_auth']
+        run_lines = [c.lineno for c in calls
+                     if isinstance(c.func, ast.Attribute) and c.func.attr == 'run']
+        self.assertTrue(auth_lines, "/prepare-shutdown must call verify_hmac_auth")
+        self.assertTrue(run_lines, "/prepare-shutdown should stop openclaw via subprocess.run")
+        self.assertLess(min(auth_lines), min(run_lines),
+                        "DoS attack should be prevented by authentication before any command runs")
+
+class TestTimestampWindow(unittest.TestCase):
+    """Test the ±300s replay window on /sync and /prepare-shutdown (TASK-173)."""
     
-    def test_prepare_shutdown_rejects_stale_timestamp(self):
-        """TASK-173 AC2: /prepare-shutdown rejects requests with stale timestamps (>300s old)."""
-        secret = 'test-secret-key'
-        
-        # Set module's API_SECRET directly
-        original_secret = self.api_module.API_SECRET
-        self.api_module.API_SECRET = secret
-        
-        try:
-            # Create stale timestamp (400 seconds ago, beyond 300s window)
-            stale_timestamp = int(time.time()) - 400
-            body = b'{}'
-            
-            # Generate valid signature for the stale timestamp
-            signature = compute_hmac_signature(secret, stale_timestamp, 'POST', '/prepare-shutdown', body)
-            
-            # Should reject due to stale timestamp
-            result = self.api_module.verify_hmac_auth(
-                timestamp_header=str(stale_timestamp),
-                signature_header=signature,
-                method='POST',
-                path='/prepare-shutdown',
-                body=body
-            )
-            self.assertFalse(result[0], "/prepare-shutdown should reject requests with stale timestamps (>300s old)")
-        finally:
-            self.api_module.API_SECRET = original_secret
+    def setUp(self):
+        # One "now" per test, so signing and verifying use the same second
+        self.now = int(time.time())
     
-    def test_prepare_shutdown_accepts_timestamp_within_window(self):
-        """TASK-173 AC3: /prepare-shutdown accepts requests with timestamps within ±300s window."""
-        secret = 'test-secret-key'
-        
-        # Set module's API_SECRET directly
-        original_secret = self.api_module.API_SECRET
-        self.api_module.API_SECRET = secret
-        
-        try:
-            # Test timestamps at the edge of acceptable window
-            # 290 seconds ago (within 300s window)
-            recent_timestamp = int(time.time()) - 290
-            body = b'{}'
-            
-            signature = compute_hmac_signature(secret, recent_timestamp, 'POST', '/prepare-shutdown', body)
-            
-            result = self.api_module.verify_hmac_auth(
-                timestamp_header=str(recent_timestamp),
-                signature_header=signature,
-                method='POST',
-                path='/prepare-shutdown',
-                body=body
-            )
-            self.assertTrue(result[0], "/prepare-shutdown should accept timestamps within ±300s window")
-        finally:
-            self.api_module.API_SECRET = original_secret
+    # (timestamp offset from now in seconds, path, accepted)
+    CASES = [
+        (-400, '/sync', False),               # AC1: stale
+        (-290, '/sync', True),                # AC3: within window
+        (+400, '/sync', False),               # AC4: future
+        (-400, '/prepare-shutdown', False),   # AC2: stale
+        (-290, '/prepare-shutdown', True),    # AC3: within window
+        (+400, '/prepare-shutdown', False),   # AC4: future
+    ]
     
-    def test_prepare_shutdown_rejects_future_timestamp(self):
-        """TASK-173 AC4: /prepare-shutdown rejects requests with timestamps too far in future (>300s)."""
-        secret = 'test-secret-key'
-        
-        # Set module's API_SECRET directly
-        original_secret = self.api_module.API_SECRET
-        self.api_module.API_SECRET = secret
-        
-        try:
-            # Create future timestamp (400 seconds ahead, beyond 300s window)
-            future_timestamp = int(time.time()) + 400
-            body = b'{}'
-            
-            # Generate valid signature for the future timestamp
-            signature = compute_hmac_signature(secret, future_timestamp, 'POST', '/prepare-shutdown', body)
-            
-            # Should reject due to future timestamp
-            result = self.api_module.verify_hmac_auth(
-                timestamp_header=str(future_timestamp),
-                signature_header=signature,
-                method='POST',
-                path='/prepare-shutdown',
-                body=body
-            )
-            self.assertFalse(result[0], "/prepare-shutdown should reject requests with future timestamps (>300s ahead)")
-        finally:
-            self.api_module.API_SECRET = original_secret
+    def test_timestamp_window(self):
+        """TASK-173 AC1-AC4: validly signed requests are accepted only within ±300s."""
+        set_api_secret(self, TEST_SECRET)
+        
+        for offset, path, accepted in self.CASES:
+            with self.subTest(offset=offset, path=path):
+                timestamp = self.now + offset
+                
+                # Signature is valid for the timestamp; only its age decides
+                signature = compute_hmac_signature(timestamp, 'POST', path, EMPTY_JSON)
+                
+                result = api_module.verify_hmac_auth(
+                    timestamp_header=str(timestamp),
+                    signature_header=signature,
+                    method='POST',
+                    path=path,
+                    body=EMPTY_JSON
+                )
+                self.assertEqual(result[0], accepted,
+                                 f"{path} with timestamp offset {offset:+d}s: expected accepted={accepted}")
 
 
 class TestAuthCoverage(unittest.TestCase):
     """Verify all mutation endpoints have authentication."""
     
-    @classmethod
-    def setUpClass(cls):
-        """Load api-server module once for all tests."""
-        cls.api_module = load_api_server_module()
-    
     def test_all_post_endpoints_require_auth(self):
         """SEC-001 AC10: All POST endpoints must require HMAC authentication.
         
         Verifies that all mutation endpoints are protected.
         """
-        # Read api-server.py to find all POST endpoints
-        repo_root = Path(__file__).parent.parent
-        api_server_path = repo_root / "scripts" / "api-server.py"
-        
-        with open(api_server_path, 'r') as f:
-            content = f.read()
-        
-        # Find all POST endpoints (inside do_POST method only)
-        post_endpoints = []
-        in_do_post = False
-        for line in content.split('\n'):
-            if 'def do_POST(self):' in line:
-                in_do_post = True
-            elif in_do_post and line.strip().startswith('def '):
-                # Reached next method, stop
-                break
-            elif in_do_post and "self.path==" in line:
-                # Extract endpoint path
-                if "'" in line:
-                    start = line.index("'") + 1
-                    end = line.index("'", start)
-                    endpoint = line[start:end]
-                    if endpoint.startswith('/'):
-                        post_endpoints.append(endpoint)
+        # Find all POST endpoints (paths compared with self.path in do_POST)
+        collector = _PostEndpointCollector()
+        collector.visit(ast.parse(API_SERVER_SOURCE, filename=str(API_SERVER_PATH)))
+        post_endpoints = collector.paths
         
         # Known authenticated endpoints
         authenticated_endpoints = [
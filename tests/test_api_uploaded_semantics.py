@@ -6,6 +6,7 @@ These tests verify the behavior when config is:
 - Uploaded via API (api-uploaded mode)
 - Missing entirely (unconfigured)
 """
+import ast
 import json
 import os
 import sys
@@ -18,68 +19,60 @@ import pytest
 
 REPO_ROOT = Path(__file__).parent.parent
 SCRIPTS_DIR = REPO_ROOT / "scripts"
+API_SERVER_PATH = SCRIPTS_DIR / "api-server.py"
 
+# Read once at import; the session fixtures below parse this copy
+API_SERVER_SOURCE = API_SERVER_PATH.read_text()
 
-def get_api_server_functions():
-    """Import api-server functions for testing."""
-    api_server_path = SCRIPTS_DIR / "api-server.py"
-    source = api_server_path.read_text()
-    
-    namespace = {
-        '__name__': 'test',
-        'os': os,
-        'json': json,
-        'time': time,
+
+def _paths_in(directory):
+    """Marker/habitat/agents paths under directory (files not created)."""
+    return {
+        'marker': directory / 'config-api-uploaded',
+        'habitat': directory / 'habitat.json',
+        'agents': directory / 'agents.json',
     }
-    
-    # Extract and execute the relevant functions
-    # We need: get_config_status, get_config_upload_status, write_upload_marker
-    
-    # Find MARKER_PATH constant
-    namespace['MARKER_PATH'] = '/tmp/test-config-api-uploaded'
-    namespace['HABITAT_PATH'] = '/tmp/test-habitat.json'
-    namespace['AGENTS_PATH'] = '/tmp/test-agents.json'
-    
-    # Extract functions
-    for func_name in ['get_config_status', 'get_config_upload_status', 'write_upload_marker']:
-        start = source.find(f'def {func_name}')
-        if start == -1:
-            raise ValueError(f"Function {func_name} not found")
-        
-        # Find end of function (next 'def ' at same indentation or class/EOF)
-        end = source.find('\ndef ', start + 1)
-        if end == -1:
-            end = source.find('\nclass ', start + 1)
-        if end == -1:
-            end = len(source)
-        
-        func_source = source[start:end]
-        exec(func_source, namespace)
-    
-    return namespace
 
 
 @pytest.fixture
 def temp_paths(tmp_path):
     """Create temporary paths for testing."""
-    paths = {
-        'marker': tmp_path / 'config-api-uploaded',
-        'habitat': tmp_path / 'habitat.json',
-        'agents': tmp_path / 'agents.json',
-    }
-    yield paths
-    # Cleanup
-    for p in paths.values():
-        if p.exists():
-            p.unlink()
+    return _paths_in(tmp_path)
+
+
+@pytest.fixture(scope="session")
+def empty_paths(tmp_path_factory):
+    """Paths in one shared directory that stays empty, for read-only tests."""
+    return _paths_in(tmp_path_factory.mktemp("unconfigured"))
+
+
+# Functions under test, extracted from api-server.py
+API_FUNC_NAMES = ['get_config_status', 'get_config_upload_status', '_read_marker', 'write_upload_marker']
+
+
+@pytest.fixture(scope="session")
+def _api_tree():
+    """api-server.py parsed once per session."""
+    return ast.parse(API_SERVER_SOURCE, filename=str(API_SERVER_PATH))
+
+
+@pytest.fixture(scope="session")
+def _api_code(_api_tree):
+    """Compile the api-server functions under test once per session."""
+    tree = _api_tree
+    funcs = {node.name: node for node in tree.body
+             if isinstance(node, ast.FunctionDef) and node.name in API_FUNC_NAMES}
+    missing = set(API_FUNC_NAMES) - funcs.keys()
+    if missing:
+        raise ValueError(f"Functions not found in api-server.py: {sorted(missing)}")
+    
+    module = ast.Module(body=[funcs[name] for name in API_FUNC_NAMES], type_ignores=[])
+    return compile(module, str(API_SERVER_PATH), 'exec')
 
 
 @pytest.fixture
-def api_funcs(temp_paths):
+def api_funcs(_api_code, temp_paths):
     """Get api-server functions with mocked paths."""
-    api_server_path = SCRIPTS_DIR / "api-server.py"
-    source = api_server_path.read_text()
-    
     namespace = {
         '__name__': 'test',
         'os': os,
@@ -91,24 +84,27 @@ def api_funcs(temp_paths):
         'AGENTS_PATH': str(temp_paths['agents']),
     }
     
-    # Extract functions
-    for func_name in ['get_config_status', 'get_config_upload_status', 'write_upload_marker']:
-        start = source.find(f'def {func_name}')
-        end = source.find('\ndef ', start + 1)
-        if end == -1:
-            end = source.find('\nclass ', start + 1)
-        if end == -1:
-            end = len(source)
-        
-        func_source = source[start:end]
-        exec(func_source, namespace)
+    # Bind the precompiled functions into this test's namespace
+    exec(_api_code, namespace)
     
     return namespace
 
 
+@pytest.fixture(scope="session")
+def api_docstrings(_api_tree):
+    """Docstring of each top-level api-server function, by name."""
+    return {node.name: ast.get_docstring(node) or "" for node in _api_tree.body
+            if isinstance(node, ast.FunctionDef)}
+
+
 class TestUnconfiguredState:
     """Test state when no config exists (fresh droplet)."""
 
+    @pytest.fixture
+    def temp_paths(self, empty_paths):
+        """These tests only read status, so they share one empty directory."""
+        return empty_paths
+
     def test_no_files_means_unconfigured(self, api_funcs, temp_paths):
         """Fresh droplet with no files should show unconfigured state."""
         status = api_funcs['get_config_status']()
@@ -183,11 +179,12 @@ class TestApiUploadedMode:
     def test_marker_contains_timestamp(self, api_funcs, temp_paths):
         """Marker file should contain Unix timestamp."""
         before = time.time()
-        api_funcs['write_upload_marker']()
+        result = api_funcs['write_upload_marker']()
         after = time.time()
         
-        timestamp = float(temp_paths['marker'].read_text())
+        timestamp = float(temp_paths['marker'].read_bytes())
         assert before <= timestamp <= after
+        assert result['timestamp'] == timestamp
 
     def test_config_with_marker_shows_uploaded(self, api_funcs, temp_paths):
         """Config with marker should show api_uploaded=True."""
@@ -247,48 +244,64 @@ class TestStateTransitions:
         assert status2['api_uploaded'] is True
         assert status2['habitat_exists'] is True
 
-    def test_multiple_uploads_update_timestamp(self, api_funcs, temp_paths):
+    def test_multiple_uploads_update_timestamp(self, api_funcs, temp_paths, monkeypatch):
         """Multiple API uploads should update timestamp."""
-        api_funcs['write_upload_marker']()
-        ts1 = float(temp_paths['marker'].read_text())
+        # Injected clock: two uploads, two distinct times, no real sleep
+        clock = mock.Mock(time=mock.Mock(side_effect=[1000.0, 1000.5]))
+        monkeypatch.setitem(api_funcs, 'time', clock)
         
-        time.sleep(0.01)  # Small delay to ensure different timestamp
-        api_funcs['write_upload_marker']()
-        ts2 = float(temp_paths['marker'].read_text())
+        ts1 = api_funcs['write_upload_marker']()['timestamp']
+        assert float(temp_paths['marker'].read_bytes()) == ts1
         
-        assert ts2 > ts1
+        ts2 = api_funcs['write_upload_marker']()['timestamp']
+        assert float(temp_paths['marker'].read_bytes()) == ts2
+        
+        assert (ts1, ts2) == (1000.0, 1000.5)
+
+    def test_status_follows_marker_rewrite_removal_and_replacement(self, api_funcs, temp_paths):
+        """Status tracks the marker file as it changes between polls."""
+        marker = temp_paths['marker']
+        api_funcs['write_upload_marker']()
+        assert api_funcs['get_config_upload_status']()['api_uploaded'] is True
+
+        marker.write_text('100.5')
+        assert api_funcs['get_config_upload_status']()['api_uploaded_at'] == 100.5
+
+        # A new file renamed over the marker (different inode) is picked up
+        replacement = marker.with_name('marker.new')
+        replacement.write_text('200.0')
+        replacement.rename(marker)
+        assert api_funcs['get_config_upload_status']()['api_uploaded_at'] == 200.0
+
+        marker.unlink()
+        assert api_funcs['get_config_upload_status']()['api_uploaded'] is False
+        assert api_funcs['get_config_status']()['api_uploaded'] is False
 
 
 class TestDocstringPresence:
     """Verify docstrings document api_uploaded semantics."""
 
-    def test_write_upload_marker_documents_modes(self):
+    def test_write_upload_marker_documents_modes(self, api_docstrings):
         """write_upload_marker should document both modes."""
-        source = (SCRIPTS_DIR / "api-server.py").read_text()
+        docstring = api_docstrings['write_upload_marker']
         
-        # Check for key documentation terms
-        assert "API-UPLOADED MODE" in source or "api_uploaded" in source
-        assert "APPLY-ONLY MODE" in source or "apply-only" in source.lower()
+        assert "API-UPLOADED MODE" in docstring
+        assert "APPLY-ONLY MODE" in docstring
 
-    def test_get_config_status_documents_matrix(self):
+    def test_get_config_status_documents_matrix(self, api_docstrings):
         """get_config_status should document state matrix."""
-        source = (SCRIPTS_DIR / "api-server.py").read_text()
+        docstring = api_docstrings['get_config_status']
         
         # Should document the relationship between api_uploaded and habitat_exists
-        assert "api_uploaded" in source
-        assert "habitat_exists" in source
+        assert "api_uploaded" in docstring
+        assert "habitat_exists" in docstring
 
-    def test_get_config_upload_status_warns_about_semantics(self):
+    def test_get_config_upload_status_warns_about_semantics(self, api_docstrings):
         """get_config_upload_status should warn api_uploaded=False doesn't mean unconfigured."""
-        source = (SCRIPTS_DIR / "api-server.py").read_text()
-        
-        # Find the docstring for get_config_upload_status
-        start = source.find('def get_config_upload_status')
-        end = source.find('result={"api_uploaded"', start)
-        docstring = source[start:end]
+        docstring = api_docstrings['get_config_upload_status']
         
         # Should warn about the semantics
-        assert "false" in docstring.lower() or "False" in docstring
+        assert "api_uploaded=False" in docstring
         assert "unconfigured" in docstring.lower() or "apply-only" in docstring.lower()
 
 
@@ -9,6 +9,10 @@ from pathlib import Path
 
 REPO_ROOT = Path(__file__).parent.parent
 SCRIPTS_DIR = REPO_ROOT / "scripts"
+APPLY_CONFIG_PATH = SCRIPTS_DIR / "apply-config.sh"
+
+# Read once at import for both tests
+APPLY_CONFIG_SOURCE = APPLY_CONFIG_PATH.read_text()
 
 
 class TestApplyConfigRename:
@@ -16,10 +20,7 @@ class TestApplyConfigRename:
 
     def test_apply_config_calls_rename_bots(self):
         """apply-config.sh must call rename-bots.sh after build-full-config.sh."""
-        script_path = SCRIPTS_DIR / "apply-config.sh"
-        assert script_path.exists(), "apply-config.sh not found"
-        
-        content = script_path.read_text()
+        content = APPLY_CONFIG_SOURCE
         
         # Must call rename-bots.sh
         assert "rename-bots.sh" in content, (
@@ -28,21 +29,13 @@ class TestApplyConfigRename:
 
     def test_rename_after_build_config(self):
         """rename-bots.sh must be called AFTER build-full-config.sh."""
-        script_path = SCRIPTS_DIR / "apply-config.sh"
-        content = script_path.read_text()
-        
-        lines = content.split('\n')
-        build_line = None
-        rename_line = None
+        content = APPLY_CONFIG_SOURCE
         
-        for i, line in enumerate(lines, 1):
-            # Find the actual execution line (not just echo statements about it)
-            # build-full-config.sh execution starts with /
-            if '/build-full-config.sh' in line:
-                build_line = i
-            # rename-bots.sh execution starts with /
-            if '/rename-bots.sh' in line:
-                rename_line = i
+        # Line of the last mention of each script path (executions start with /)
+        build_pos = content.rfind('/build-full-config.sh')
+        rename_pos = content.rfind('/rename-bots.sh')
+        build_line = content.count('\n', 0, build_pos) + 1 if build_pos != -1 else None
+        rename_line = content.count('\n', 0, rename_pos) + 1 if rename_pos != -1 else None
         
         assert build_line is not None, "Could not find build-full-config.sh call"
         assert rename_line is not None, "Could not find rename-bots.sh call"
@@ -3,32 +3,46 @@
 DigitalOcean's cloud-init parser rejects non-ASCII (em dashes, arrows,
 curly quotes, etc.). This test catches them before they reach production.
 """
-import pathlib, pytest
+import pathlib, re, pytest
 
-REPO = pathlib.Path(__file__).resolve().parent.parent
+REPO = pathlib.Path(__file__).parent.parent
 
 # Files that MUST be pure ASCII (only YAML files that go through iOS Shortcut pipeline)
 # Scripts are fetched directly from GitHub and can contain emoji/Unicode
 ASCII_REQUIRED = [
     "hatch.yaml",
-    "hatch.yaml",
 ]
 
+NON_ASCII = re.compile(rb"[\x80-\xff]")
+
+
+@pytest.fixture(scope="session")
+def cloud_init_bytes():
+    """Contents of each existing ASCII_REQUIRED file, read once per session."""
+    return {p: (REPO / p).read_bytes() for p in ASCII_REQUIRED if (REPO / p).exists()}
+
 
 @pytest.mark.parametrize("relpath", ASCII_REQUIRED)
-def test_no_non_ascii(relpath):
+def test_no_non_ascii(relpath, cloud_init_bytes):
     """Reject any byte > 127 in cloud-init files."""
-    fp = REPO / relpath
-    if not fp.exists():
+    if relpath not in cloud_init_bytes:
         pytest.skip(f"{relpath} not found")
-    content = fp.read_bytes()
+    content = cloud_init_bytes[relpath]
+    if content.isascii():
+        return
     bad = []
-    for i, b in enumerate(content):
-        if b > 127:
-            line = content[:i].count(b"\n") + 1
-            col = i - content[:i].rfind(b"\n")
-            snippet = content[max(0, i - 15) : i + 15]
-            bad.append(f"  line {line}, col {col}: byte 0x{b:02x} near: {snippet}")
+    line, line_start, pos = 1, 0, 0
+    for m in NON_ASCII.finditer(content):
+        i = m.start()
+        # Advance the line count from the previous hit instead of rescanning content[:i]
+        line += content.count(b"\n", pos, i)
+        nl = content.rfind(b"\n", line_start, i)
+        if nl != -1:
+            line_start = nl + 1
+        pos = i
+        col = i - line_start + 1
+        snippet = content[max(0, i - 15) : i + 15]
+        bad.append(f"  line {line}, col {col}: byte 0x{content[i]:02x} near: {snippet}")
     assert not bad, (
         f"Non-ASCII characters in {relpath} will break cloud-init:\n"
         + "\n".join(bad[:10])
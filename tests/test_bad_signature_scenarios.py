@@ -12,81 +12,113 @@ Covers scenarios not tested elsewhere:
 """
 
 import pytest
+import functools
 import hmac
 import hashlib
+import importlib.util
 import time
-import os
+from pathlib import Path
+
+API_SERVER_PATH = Path(__file__).parent.parent / "scripts" / "api-server.py"
 
 
 def load_api_server():
-    """Load api-server.py as a module for testing."""
-    with open('scripts/api-server.py', 'r') as f:
-        code = f.read()
-    globals_dict = {'__name__': '__test__'}
-    exec(code, globals_dict)
-    return globals_dict
+    """Load api-server.py as a module for testing; returns its namespace.
+    
+    Loaded through importlib (not exec of the source) so the compiled
+    bytecode is cached in scripts/__pycache__ between runs.
+    """
+    spec = importlib.util.spec_from_file_location("api_server", API_SERVER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.__dict__
+
+
+@pytest.fixture(scope="module")
+def api_server():
+    """api-server.py loaded once for the whole module.
+    
+    verify_hmac_auth reads the module global API_SECRET, so tests set that
+    entry (via monkeypatch.setitem) instead of re-loading per secret.
+    """
+    return load_api_server()
 
 
+# Secret the server is configured with in most tests; signing under it
+# copies this pre-keyed template instead of re-keying an HMAC per call
+TEST_SECRET = 'test-secret-key-123'
+_HMAC_TEMPLATE = hmac.new(TEST_SECRET.encode(), digestmod=hashlib.sha256)
+
+
+@functools.lru_cache(maxsize=128)
 def compute_hmac_signature(secret, timestamp, method, path, body):
-    """Compute HMAC-SHA256 signature for a request."""
-    if isinstance(body, bytes):
-        body = body.decode('utf-8')
+    """Compute HMAC-SHA256 signature for a request (cached: it is pure)."""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
     elif body is None:
-        body = ''
+        body = b''
     
-    message = f"{timestamp}.{method}.{path}.{body}"
-    return hmac.new(secret.encode(), message.encode(), hashlib.sha256).hexdigest()
+    if secret == TEST_SECRET:
+        h = _HMAC_TEMPLATE.copy()
+    else:
+        h = hmac.new(secret.encode(), digestmod=hashlib.sha256)
+    h.update(f"{timestamp}.{method}.{path}.".encode() + body)
+    return h.hexdigest()
+
+
+@pytest.fixture(scope="class")
+def valid_sig_bundle():
+    """(timestamp, body, signature) correctly signed with the test secret."""
+    timestamp = str(int(time.time()))
+    body = b'{"test": "data"}'
+    signature = compute_hmac_signature(
+        TEST_SECRET, timestamp, 'POST', '/config/upload', body
+    )
+    return timestamp, body, signature
 
 
 class TestBadSignatureScenarios:
     """Comprehensive tests for invalid signature rejection."""
     
     @pytest.fixture(autouse=True)
-    def setup(self):
+    def setup(self, api_server, monkeypatch):
         """Set up test environment with known API_SECRET."""
-        os.environ['API_SECRET'] = 'test-secret-key-123'
-        self.api = load_api_server()
-        yield
-        # Cleanup not strictly necessary since each test gets fresh env
+        monkeypatch.setitem(api_server, 'API_SECRET', TEST_SECRET)
+        self.api = api_server
     
-    def test_random_string_signature_rejected(self):
+    @pytest.mark.parametrize("bad_sig", [
+        "invalid-signature",
+        "not-a-signature",
+        "123456",
+        "random_text_12345",
+        "攻撃者",  # Unicode characters
+    ])
+    def test_random_string_signature_rejected(self, bad_sig, valid_sig_bundle):
         """TASK-174 AC2.1: Completely invalid signature (random string) is rejected.
         
         Validates: Server rejects signatures that are not valid hex strings.
         Scenario: Attacker tries "invalid-signature" or other random text.
         """
-        timestamp = str(int(time.time()))
-        body = b'{"test": "data"}'
-        
-        # Try various random string signatures
-        bad_signatures = [
-            "invalid-signature",
-            "not-a-signature",
-            "123456",
-            "random_text_12345",
-            "攻撃者",  # Unicode characters
-        ]
+        timestamp, body, _ = valid_sig_bundle
         
-        for bad_sig in bad_signatures:
-            result = self.api['verify_hmac_auth'](
-                timestamp, bad_sig, 'POST', '/config/upload', body
-            )
-            assert result[0] is False, f"Random string signature '{bad_sig}' should be rejected"
+        result = self.api['verify_hmac_auth'](
+            timestamp, bad_sig, 'POST', '/config/upload', body
+        )
+        assert result[0] is False, f"Random string signature '{bad_sig}' should be rejected"
     
-    def test_wrong_secret_key_signature_rejected(self):
+    def test_wrong_secret_key_signature_rejected(self, valid_sig_bundle):
         """TASK-174 AC2.5: Signature signed with wrong secret key is rejected.
         
         Validates: Server only accepts signatures signed with correct API_SECRET.
         Scenario: Attacker uses leaked/guessed wrong secret key.
         """
-        timestamp = str(int(time.time()))
-        body = b'{"test": "data"}'
+        timestamp, body, _ = valid_sig_bundle
         
         # Sign with WRONG secret key
         wrong_secret = 'different-secret-key'
         signature = compute_hmac_signature(wrong_secret, timestamp, 'POST', '/config/upload', body)
         
-        # Should reject (API_SECRET is 'test-secret-key-123')
+        # Should reject (API_SECRET is TEST_SECRET)
         result = self.api['verify_hmac_auth'](
             timestamp, signature, 'POST', '/config/upload', body
         )
@@ -104,7 +136,7 @@ class TestBadSignatureScenarios:
         
         # Sign the original body
         signature = compute_hmac_signature(
-            'test-secret-key-123', timestamp, 'POST', '/config/upload', original_body
+            TEST_SECRET, timestamp, 'POST', '/config/upload', original_body
         )
         
         # Try to use signature with tampered body
@@ -113,28 +145,26 @@ class TestBadSignatureScenarios:
         )
         assert result[0] is False, "Signature for different body should be rejected"
     
-    def test_empty_signature_rejected(self):
+    def test_empty_signature_rejected(self, valid_sig_bundle):
         """TASK-174 Bonus: Empty signature is rejected.
         
         Validates: Server handles edge case of empty signature string.
         Scenario: Client sends X-Signature header but with empty value.
         """
-        timestamp = str(int(time.time()))
-        body = b'{"test": "data"}'
+        timestamp, body, _ = valid_sig_bundle
         
         result = self.api['verify_hmac_auth'](
             timestamp, "", 'POST', '/config/upload', body
         )
         assert result[0] is False, "Empty signature should be rejected"
     
-    def test_hex_like_but_invalid_signature_rejected(self):
+    def test_hex_like_but_invalid_signature_rejected(self, valid_sig_bundle):
         """TASK-174 Bonus: Valid hex format but wrong signature is rejected.
         
         Validates: Server doesn't just check hex format, but validates actual signature.
         Scenario: Attacker generates valid-looking hex but incorrect signature.
         """
-        timestamp = str(int(time.time()))
-        body = b'{"test": "data"}'
+        timestamp, body, _ = valid_sig_bundle
         
         # Generate valid hex string that's NOT the correct signature
         fake_hex_sig = "a" * 64  # Valid hex format (64 chars), wrong value
@@ -156,7 +186,7 @@ class TestBadSignatureScenarios:
         
         # Sign with original timestamp
         signature = compute_hmac_signature(
-            'test-secret-key-123', original_timestamp, 'POST', '/config/upload', body
+            TEST_SECRET, original_timestamp, 'POST', '/config/upload', body
         )
         
         # Try to use with different timestamp
@@ -165,19 +195,13 @@ class TestBadSignatureScenarios:
         )
         assert result[0] is False, "Signature with wrong timestamp should be rejected"
     
-    def test_case_sensitivity_of_signature(self):
+    def test_case_sensitivity_of_signature(self, valid_sig_bundle):
         """TASK-174 Bonus: Signature is case-sensitive.
         
         Validates: Server performs case-sensitive comparison of signatures.
         Scenario: Attacker tries uppercase/mixed case version of valid signature.
         """
-        timestamp = str(int(time.time()))
-        body = b'{"test": "data"}'
-        
-        # Generate valid signature
-        valid_signature = compute_hmac_signature(
-            'test-secret-key-123', timestamp, 'POST', '/config/upload', body
-        )
+        timestamp, body, valid_signature = valid_sig_bundle
         
         # Try uppercase version
         uppercase_sig = valid_signature.upper()
@@ -189,19 +213,13 @@ class TestBadSignatureScenarios:
             )
             assert result[0] is False, "Uppercase version of signature should be rejected"
     
-    def test_signature_with_extra_whitespace_rejected(self):
+    def test_signature_with_extra_whitespace_rejected(self, valid_sig_bundle):
         """TASK-174 Bonus: Signature with whitespace is rejected.
         
         Validates: Server doesn't trim/normalize signature input.
         Scenario: Client accidentally includes whitespace in signature header.
         """
-        timestamp = str(int(time.time()))
-        body = b'{"test": "data"}'
-        
-        # Generate valid signature
-        valid_signature = compute_hmac_signature(
-            'test-secret-key-123', timestamp, 'POST', '/config/upload', body
-        )
+        timestamp, body, valid_signature = valid_sig_bundle
         
         # Add whitespace
         signature_with_space = f" {valid_signature} "
@@ -211,19 +229,13 @@ class TestBadSignatureScenarios:
         )
         assert result[0] is False, "Signature with whitespace should be rejected"
     
-    def test_truncated_signature_rejected(self):
+    def test_truncated_signature_rejected(self, valid_sig_bundle):
         """TASK-174 Bonus: Truncated signature is rejected.
         
         Validates: Server checks full signature length.
         Scenario: Transmission error or attacker truncates signature.
         """
-        timestamp = str(int(time.time()))
-        body = b'{"test": "data"}'
-        
-        # Generate valid signature and truncate it
-        valid_signature = compute_hmac_signature(
-            'test-secret-key-123', timestamp, 'POST', '/config/upload', body
-        )
+        timestamp, body, valid_signature = valid_sig_bundle
         
         truncated_sig = valid_signature[:32]  # Only half the signature
         
@@ -232,14 +244,13 @@ class TestBadSignatureScenarios:
         )
         assert result[0] is False, "Truncated signature should be rejected"
     
-    def test_signature_with_null_bytes_rejected(self):
+    def test_signature_with_null_bytes_rejected(self, valid_sig_bundle):
         """TASK-174 Bonus: Signature with null bytes is rejected.
         
         Validates: Server handles null bytes safely.
         Scenario: Attacker tries null byte injection.
         """
-        timestamp = str(int(time.time()))
-        body = b'{"test": "data"}'
+        timestamp, body, _ = valid_sig_bundle
         
         # Signature with null byte
         bad_signature = "abc123\x00def456"
@@ -253,32 +264,36 @@ class TestBadSignatureScenarios:
 class TestDeterministicBehavior:
     """Verify that bad signature tests are deterministic and reliable."""
     
-    def test_same_bad_signature_always_rejected(self):
+    def test_same_bad_signature_always_rejected(self, api_server, monkeypatch):
         """TASK-174 AC4: Bad signature rejection is deterministic.
         
         Validates: Same bad signature is consistently rejected across multiple calls.
+        verify_hmac_auth is a pure check, so a repeat call is enough; more
+        iterations would only redo the same work.
         """
-        os.environ['API_SECRET'] = 'test-secret-key-123'
-        api = load_api_server()
+        monkeypatch.setitem(api_server, 'API_SECRET', TEST_SECRET)
+        api = api_server
         
         timestamp = str(int(time.time()))
         body = b'{"test": "data"}'
         bad_signature = "invalid-signature-12345"
         
-        # Run same test 10 times
-        for i in range(10):
-            result = api['verify_hmac_auth'](
-                timestamp, bad_signature, 'POST', '/config/upload', body
-            )
-            assert result[0] is False, f"Iteration {i+1}: Bad signature should always be rejected"
+        first, second = (
+            api['verify_hmac_auth'](timestamp, bad_signature, 'POST', '/config/upload', body)
+            for _ in range(2)
+        )
+        assert first[0] is False, "Bad signature should be rejected"
+        assert second == first, "Bad signature should always be rejected the same way"
     
-    def test_wrong_secret_consistently_rejected(self):
+    def test_wrong_secret_consistently_rejected(self, api_server, monkeypatch):
         """TASK-174 AC4: Wrong secret signature is consistently rejected.
         
         Validates: Signature with wrong secret is reliably rejected.
+        The first call keys the server's cached HMAC template and the second
+        reuses it, so both paths are covered.
         """
-        os.environ['API_SECRET'] = 'correct-secret'
-        api = load_api_server()
+        monkeypatch.setitem(api_server, 'API_SECRET', 'correct-secret')
+        api = api_server
         
         timestamp = str(int(time.time()))
         body = b'{"test": "data"}'
@@ -288,12 +303,12 @@ class TestDeterministicBehavior:
             'wrong-secret', timestamp, 'POST', '/config/upload', body
         )
         
-        # Run same test 10 times
-        for i in range(10):
-            result = api['verify_hmac_auth'](
-                timestamp, wrong_signature, 'POST', '/config/upload', body
-            )
-            assert result[0] is False, f"Iteration {i+1}: Wrong secret should always be rejected"
+        first, second = (
+            api['verify_hmac_auth'](timestamp, wrong_signature, 'POST', '/config/upload', body)
+            for _ in range(2)
+        )
+        assert first[0] is False, "Wrong secret should be rejected"
+        assert second == first, "Wrong secret should always be rejected the same way"
 
 
 if __name__ == '__main__':
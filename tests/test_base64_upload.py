@@ -11,6 +11,9 @@ import json
 import time
 import unittest
 
+# Whitespace the server strips from base64 bodies before decoding
+_WS_TABLE = str.maketrans('', '', '\n\r ')
+
 
 class TestBase64BodyDecoding(unittest.TestCase):
     """Test base64 body decoding logic."""
@@ -24,7 +27,7 @@ class TestBase64BodyDecoding(unittest.TestCase):
         wrapped = '\n'.join([encoded[i:i+20] for i in range(0, len(encoded), 20)])
         
         # Strip and decode (as server does)
-        cleaned = wrapped.replace('\n', '').replace('\r', '').replace(' ', '')
+        cleaned = wrapped.translate(_WS_TABLE)
         decoded = base64.b64decode(cleaned).decode('utf-8')
         
         self.assertEqual(decoded, original)
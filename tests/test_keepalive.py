@@ -16,6 +16,7 @@ import hashlib
 import time
 import os
 import re
+from unittest.mock import patch
 
 
 API_SERVER_PATH = os.path.join(
@@ -45,7 +46,9 @@ class TestKeepaliveAuth(unittest.TestCase):
     """Auth-level tests for /keepalive — these exercise verify_hmac_auth directly."""
 
     def setUp(self):
-        os.environ['API_SECRET'] = 'test-secret-123'
+        env = patch.dict(os.environ, {'API_SECRET': 'test-secret-123'})
+        env.start()
+        self.addCleanup(env.stop)
         self.api = load_api_server()
         self.verify = self.api['verify_hmac_auth']
 
@@ -133,6 +133,57 @@ class TestRootValidation:
         assert result.returncode == 1
         assert "must be a JSON object" in result.stderr
 
+    def test_invalid_base64_rejected(self):
+        """Malformed HABITAT_B64 should fail fast with a base64 error."""
+        env = os.environ.copy()
+        env['HABITAT_B64'] = 'not*valid*base64'
+        result = subprocess.run(
+            ['python3', str(PARSE_HABITAT)],
+            env=env,
+            capture_output=True,
+            text=True
+        )
+        assert result.returncode == 1
+        assert "not valid base64" in result.stderr
+
+    def test_oversized_base64_rejected(self):
+        """HABITAT_B64 over the size cap should be rejected before decoding."""
+        # Oversized values exceed the kernel's per-env-string limit, so set
+        # the variable inside the child process instead of via env=
+        wrapper = f'''
+import os
+os.environ["HABITAT_B64"] = "A" * (4 * 1024 * 1024 + 4)
+exec(open("{PARSE_HABITAT}").read())
+'''
+        result = subprocess.run(
+            ['python3', '-c', wrapper],
+            capture_output=True,
+            text=True
+        )
+        assert result.returncode == 1
+        assert "HABITAT_B64 too large" in result.stderr
+
+    def test_outputs_written_atomically(self):
+        """habitat.json and the env file should be complete, 0600, and leave no temp files."""
+        habitat = {"name": "Test", "agents": [{"agent": "Claude"}]}
+        env = os.environ.copy()
+        env['HABITAT_B64'] = base64.b64encode(json.dumps(habitat).encode()).decode()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env['HABITAT_OUTPUT_DIR'] = tmpdir
+            result = subprocess.run(
+                ['python3', str(PARSE_HABITAT)],
+                env=env,
+                capture_output=True,
+                text=True
+            )
+            assert result.returncode == 0, result.stderr
+            out = Path(tmpdir)
+            assert json.loads((out / "habitat.json").read_text()) == habitat
+            assert 'HABITAT_NAME="Test"' in (out / "habitat-parsed.env").read_text()
+            for name in ("habitat.json", "habitat-parsed.env"):
+                assert (out / name).stat().st_mode & 0o777 == 0o600
+            assert not list(out.glob("*.tmp"))
+
 
 class TestNameValidation:
     """Test validation of 'name' field."""
@@ -540,6 +591,47 @@ exec(open("{PARSE_HABITAT}").read())
             assert result.returncode == 0
             assert "WARN" in result.stderr
 
+    def test_agent_lib_invalid_base64_warns(self):
+        """Malformed AGENT_LIB_B64 should warn and fall back to empty library."""
+        habitat = {"name": "Test", "agents": [{"agent": "Claude"}]}
+        env = os.environ.copy()
+        env['HABITAT_B64'] = base64.b64encode(json.dumps(habitat).encode()).decode()
+        env['AGENT_LIB_B64'] = 'not*valid*base64'
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env['HABITAT_OUTPUT_DIR'] = tmpdir
+            result = subprocess.run(
+                ['python3', str(PARSE_HABITAT)],
+                env=env,
+                capture_output=True,
+                text=True
+            )
+            assert result.returncode == 0
+            assert "AGENT_LIB_B64 is not valid base64" in result.stderr
+
+    def test_line_wrapped_base64_accepted(self):
+        """HABITAT_B64 and AGENT_LIB_B64 wrapped at 76 columns should decode."""
+        habitat = {"name": "Wrapped" * 20, "agents": [{"agent": "Claude"}]}
+        agent_lib = {"Claude": {"model": "test/wrapped-model", "identity": "x" * 200}}
+        env = os.environ.copy()
+        env['HABITAT_B64'] = base64.encodebytes(json.dumps(habitat).encode()).decode()
+        env['AGENT_LIB_B64'] = base64.encodebytes(json.dumps(agent_lib).encode()).decode()
+        assert '\n' in env['HABITAT_B64'].rstrip('\n')
+        assert '\n' in env['AGENT_LIB_B64'].rstrip('\n')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env['HABITAT_OUTPUT_DIR'] = tmpdir
+            result = subprocess.run(
+                ['python3', str(PARSE_HABITAT)],
+                env=env,
+                capture_output=True,
+                text=True
+            )
+            assert result.returncode == 0, result.stderr
+            assert "WARN" not in result.stderr
+            env_text = (Path(tmpdir) / "habitat-parsed.env").read_text()
+            assert 'AGENT1_MODEL="test/wrapped-model"' in env_text
+
 
 class TestEdgeCases:
     """Test edge cases and unusual inputs."""